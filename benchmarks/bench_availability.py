@@ -0,0 +1,56 @@
+#! /usr/bin/python3
+"""
+Availability benchmark : cost of the last seen bookkeeping per frame
+
+Frames from DEVICES devices (random order) move their deadlines, for
+1000 to 10000 devices : the cost per frame should barely grow.
+Then all devices but one stop sending, and all of them but that one
+must go unavailable.
+
+Run from the repository root : python3 benchmarks/bench_availability.py
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from zigate.availability import ZiGateAvailability  # noqa: E402
+
+FRAMES = 200000
+TIMEOUT = 0.5
+
+
+async def run(devices):
+    loop = asyncio.get_event_loop()
+    availability = ZiGateAvailability(loop, TIMEOUT)
+    addrs = ['{:04x}'.format(i) for i in range(devices)]
+    unavailable = set()
+    for addr in addrs:
+        availability.register(addr, lambda available, addr=addr: unavailable.add(addr),
+                              reports=True)
+    frames = [random.choice(addrs) for _ in range(FRAMES)]
+    start = time.perf_counter()
+    for addr in frames:
+        availability.seen(addr)
+    elapsed = time.perf_counter() - start
+    for _ in range(4):
+        await asyncio.sleep(TIMEOUT / 2)
+        availability.seen(addrs[0])
+    print('{:>6} devices : {:.2f} us per frame, {} unavailable / {} expected'.format(
+        devices, 1e6 * elapsed / FRAMES, len(unavailable), devices - 1))
+    availability.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    loop = asyncio.get_event_loop()
+    for devices in (1000, 3000, 10000):
+        loop.run_until_complete(run(devices))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#! /usr/bin/python3
+"""
+Dispatch benchmark : properties routed to entities per second
+
+before : signal name formatted per property + debug logging + signal lookup
+         (the real dispatcher_send also hops through the event loop,
+         so this is a lower bound of the previous cost)
+after  : ZiGate2HASS routing table
+
+Run from the repository root : python3 benchmarks/bench_dispatch.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from homeassistant.core import callback  # noqa: E402
+from zigate.zigate2hass import ZiGate2HASS  # noqa: E402
+
+_LOGGER = logging.getLogger('zigate.bench')
+MESSAGES = 200000
+
+
+class FakeHass:
+    def __init__(self, loop):
+        self.loop = loop
+        self.data = {}
+
+
+def legacy_dispatch(signals, addr, endpoint, property_id, property_data):
+    """set_device_property before the routing table"""
+    if endpoint:
+        addrep = 'zgt_signal_update_{}'.format(addr.decode() + endpoint.decode())
+    else:
+        addrep = 'zgt_signal_update_{}'.format(addr.decode())
+    _LOGGER.debug('ZIGATE SIGNAL :')
+    _LOGGER.debug('- Signal   : {}'.format(addrep))
+    _LOGGER.debug('- Property : {}'.format(property_id))
+    _LOGGER.debug('- Data     : {}'.format(property_data))
+    for target in signals.get(addrep, []):
+        target(property_id, property_data)
+
+
+def run(entities):
+    addresses = [('{:04x}'.format(i).encode(), b'01') for i in range(entities)]
+    received = [0]
+
+    @callback
+    def update(*args):
+        received[0] += 1
+
+    # before
+    signals = {'zgt_signal_update_{}'.format(a.decode() + e.decode()): [update]
+               for a, e in addresses}
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        addr, endpoint = addresses[i % entities]
+        legacy_dispatch(signals, addr, endpoint, 'temperature', 21.5)
+    before = MESSAGES / (time.perf_counter() - start)
+
+    # after
+    zigate = ZiGate2HASS(FakeHass(asyncio.new_event_loop()), update_window=0)
+    for addr, endpoint in addresses:
+        zigate.register_entity((addr + endpoint).decode(), update)
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        addr, endpoint = addresses[i % entities]
+        zigate.set_device_property(addr, endpoint, 'temperature', 21.5)
+        zigate._commit_updates()
+    after = MESSAGES / (time.perf_counter() - start)
+
+    assert received[0] == 2 * MESSAGES
+    print('{:>6} entities : before {:>10.0f} msg/s   after {:>10.0f} msg/s   x{:.1f}'.format(
+        entities, before, after, after / before))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    for count in (1, 100, 1000):
+        run(count)
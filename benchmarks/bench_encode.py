@@ -0,0 +1,93 @@
+#! /usr/bin/python3
+"""
+Command encoding benchmark : frames per second for on/off and move to
+level commands to a few lights
+
+ - hex strings : the command built with format() and encoded by pyzigate
+   send_data (hex decoding, checksum, escaping), as the entities used to
+ - encode_frame : the payload built as bytes and framed at every command
+ - templates : the frames of ZiGate2HASS, pre-encoded per command &
+   device, on/off frames are cached, level frames only escape 3 bytes
+
+Run from the repository root : python3 benchmarks/bench_encode.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from zigate.framing import ZiGateFrameTemplate, encode_frame  # noqa: E402
+
+LIGHTS = [(0xa1b2 + i, 0x01) for i in range(20)]
+COMMANDS = 100000
+
+
+def hex_strings(on_off):
+    from pyzigate.interface import ZiGate
+
+    zigate = ZiGate()
+    zigate.send_to_transport = lambda frame: None
+    if on_off:
+        def command(addr, endpoint, n):
+            zigate.send_data('0092', '02{:04x}01{:02x}{:02x}'.format(addr, endpoint, n & 1))
+    else:
+        def command(addr, endpoint, n):
+            zigate.send_data('0081', '02{:04x}01{:02x}01{:02x}{:04x}'.format(
+                addr, endpoint, n & 0xff, 10))
+    return command
+
+
+def encoded(on_off):
+    if on_off:
+        def command(addr, endpoint, n):
+            encode_frame(0x0092, bytes((0x02, addr >> 8, addr & 0xff, 0x01, endpoint, n & 1)))
+    else:
+        def command(addr, endpoint, n):
+            encode_frame(0x0081, bytes((0x02, addr >> 8, addr & 0xff, 0x01, endpoint)) +
+                         bytes((0x01, n & 0xff)) + (10).to_bytes(2, 'big'))
+    return command
+
+
+def templates(on_off):
+    # same as ZiGate2HASS._template
+    cache = {}
+
+    def template(msg_type, addr, endpoint, fixed, variable_length):
+        key = (msg_type, 0x02, addr, endpoint)
+        found = cache.get(key)
+        if found is None:
+            found = cache[key] = ZiGateFrameTemplate(
+                msg_type, bytes((0x02, addr >> 8, addr & 0xff, 0x01, endpoint)) + fixed,
+                variable_length)
+        return found
+
+    if on_off:
+        def command(addr, endpoint, n):
+            template(0x0092, addr, endpoint, b'', 1).cached(b'\x01' if n & 1 else b'\x00')
+    else:
+        def command(addr, endpoint, n):
+            template(0x0081, addr, endpoint, b'\x01', 3).frame((n & 0xff, 0, 10))
+    return command
+
+
+def run(name, factory):
+    for on_off in (True, False):
+        command = factory(on_off)
+        start = time.perf_counter()
+        for n in range(COMMANDS):
+            addr, endpoint = LIGHTS[n % len(LIGHTS)]
+            command(addr, endpoint, n)
+        rate = COMMANDS / (time.perf_counter() - start)
+        print('{:<13}: {:<6} {:>9.0f} frames/s'.format(name, 'on/off' if on_off else 'level',
+                                                        rate))
+
+
+def main():
+    run('hex strings', hex_strings)
+    run('encode_frame', encoded)
+    run('templates', templates)
+
+
+if __name__ == '__main__':
+    main()
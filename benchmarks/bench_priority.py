@@ -0,0 +1,68 @@
+#! /usr/bin/python3
+"""
+Priority lanes benchmark : delay of a switch press queued behind a
+background sweep reading 300 sensors
+
+A fake ZiGate acknowledges every command ACK_DELAY secs after it is
+written. The sweep is queued at once, then a few switch presses are
+queued while it runs, in the background lane (like before the lanes)
+or in the interactive lane.
+
+Run from the repository root : python3 benchmarks/bench_priority.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from zigate.framing import encode_frame  # noqa: E402
+from zigate.transmit import (ZiGateTransmitQueue, ZGT_PRIORITY_INTERACTIVE,  # noqa: E402
+                             ZGT_PRIORITY_BACKGROUND)
+
+SENSORS = 300
+PRESSES = 5
+ACK_DELAY = 0.005
+
+
+async def run(press_priority):
+    loop = asyncio.get_event_loop()
+    written = {}
+    # frame -> type (frames are escaped)
+    types = {}
+
+    def write(frame):
+        written[frame] = loop.time()
+        loop.call_later(ACK_DELAY, tx.status_received, 0, types[frame])
+
+    tx = ZiGateTransmitQueue(loop, write, max_size=SENSORS + PRESSES)
+    tx.resume()
+    for i in range(SENSORS):
+        frame = encode_frame(0x0100, i.to_bytes(2, 'big'))
+        types[frame] = 0x0100
+        tx.put(0x0100, frame, priority=ZGT_PRIORITY_BACKGROUND)
+    delays = []
+    for i in range(PRESSES):
+        await asyncio.sleep(SENSORS * ACK_DELAY / (PRESSES + 1))
+        frame = encode_frame(0x0092, bytes((0x02, 0x10, i, 0x01, 0x01, 0x01)))
+        types[frame] = 0x0092
+        queued = loop.time()
+        tx.put(0x0092, frame, priority=press_priority)
+        while frame not in written:
+            await asyncio.sleep(0.001)
+        delays.append(written[frame] - queued)
+    while tx.size:
+        await asyncio.sleep(0.01)
+    print('{:<12}: switch press delay (ms) mean {:.1f}  max {:.1f}'.format(
+        'interactive' if press_priority == ZGT_PRIORITY_INTERACTIVE else 'single lane',
+        1000 * sum(delays) / len(delays), 1000 * max(delays)))
+
+
+def main():
+    loop = asyncio.get_event_loop()
+    for priority in (ZGT_PRIORITY_BACKGROUND, ZGT_PRIORITY_INTERACTIVE):
+        loop.run_until_complete(run(priority))
+
+
+if __name__ == '__main__':
+    main()
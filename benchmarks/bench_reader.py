@@ -0,0 +1,119 @@
+#! /usr/bin/python3
+"""
+Reader thread benchmark : event loop latency during a burst of reports
+on a serial link (a pty), read on the loop or by the reader thread
+
+A probe sleeping 1 ms in a loop measures how late the loop wakes it up,
+while the emulator (a child process, not competing for the GIL) writes
+2000 reports per second. The time the loop spends on the frames is
+given too (per frame : framing & interpretation, or only applying the
+properties found by the thread).
+
+Run from the repository root : python3 benchmarks/bench_reader.py
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import tty
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+from homeassistant.core import callback  # noqa: E402
+from zigate.reader import create_threaded_serial_connection  # noqa: E402
+from zigate.zigate2hass import ZiGate2HASS, ZiGateProtocol  # noqa: E402
+from zigate_emulator import ZiGateEmulator, FIRST_ADDRESS, ENDPOINT  # noqa: E402
+from zigate_replay import StubHass  # noqa: E402
+
+DEVICES = 500
+RATE = 2000
+DURATION = 5
+PROBE_INTERVAL = 0.001
+
+
+def burst(master, stop):
+    """Write RATE reports per second on the pty, in a child process"""
+    def write(data):
+        while data:
+            data = data[os.write(master, data):]
+
+    emulator = ZiGateEmulator(DEVICES, write)
+    start = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        due = int((time.perf_counter() - start) * RATE) - sent
+        if due > 0:
+            sent += emulator.send_reports(due)
+        time.sleep(0.002)
+
+
+async def probe(duration):
+    """Lateness of 1 ms sleeps (secs)"""
+    lags = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        before = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - before - PROBE_INTERVAL)
+    return lags
+
+
+async def run(threaded):
+    loop = asyncio.get_event_loop()
+    hass = StubHass(loop)
+    zigate = ZiGate2HASS(hass, update_window=0)
+    updates = [0]
+
+    @callback
+    def update(attributes):
+        updates[0] += 1
+
+    for i in range(DEVICES):
+        zigate.register_entity('{:04x}{:02x}'.format(FIRST_ADDRESS + i, ENDPOINT), update)
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    if threaded:
+        transport, _ = await create_threaded_serial_connection(
+            loop, lambda: ZiGateProtocol(zigate), os.ttyname(slave), 115200)
+    else:
+        transport, _ = await loop.connect_read_pipe(
+            lambda: ZiGateProtocol(zigate), os.fdopen(slave, 'rb', 0))
+
+    context = multiprocessing.get_context('fork')
+    stop = context.Event()
+    writer = context.Process(target=burst, args=(master, stop))
+    writer.start()
+    lags = await probe(DURATION)
+    stop.set()
+    writer.join()
+    await asyncio.sleep(0.5)
+    transport.close()
+    await asyncio.sleep(0.1)
+    os.close(master)
+
+    lags.sort()
+    stats = zigate.stats
+    print('{:<12}: {:>6} updates   loop {:>5.1f} us/frame   loop lag (ms) p50 {:.3f}  '
+          'p99 {:.3f}  max {:.3f}'.format(
+              'reader thread' if threaded else 'on the loop', updates[0],
+              # the dispatch to the entities is part of it (no update window)
+              1e6 * stats.decode_time.total / max(1, stats.frames_received),
+              *[1000 * lags[min(len(lags) - 1, int(len(lags) * p / 100))]
+                for p in (50, 99, 100)]))
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('zigate').setLevel(logging.ERROR)
+    loop = asyncio.get_event_loop()
+    for threaded in (False, True):
+        loop.run_until_complete(run(threaded))
+
+
+if __name__ == '__main__':
+    main()
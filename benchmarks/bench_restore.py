@@ -0,0 +1,85 @@
+#! /usr/bin/python3
+"""
+Restore benchmark : state writes (i.e. state_changed events on the bus)
+caused by restoring the sensors at startup
+
+before : update_attributes per restored attribute, one write each
+after  : all attributes restored at once, no write of ours
+(hass writes every entity once after async_added_to_hass in both cases)
+
+Run from the repository root : python3 benchmarks/bench_restore.py
+"""
+import asyncio
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+# the repository is the custom_components folder of hass
+custom_components = types.ModuleType('custom_components')
+custom_components.__path__ = [ROOT]
+sys.modules.setdefault('custom_components', custom_components)
+
+from custom_components.sensor.zigate import ZiGateSensor  # noqa: E402
+from custom_components.zigate.zigate2hass import ZiGate2HASS  # noqa: E402
+from zigate_replay import StubHass  # noqa: E402
+
+SENSORS = 300
+ATTRIBUTES = {'temperature': 21.5, 'humidity': 48.2, 'pressure': 1013, 'battery': 3.05,
+              'last seen': '2018-08-01 10:00:00', 'type': 'lumi.weather',
+              'detailed pressure': 1013.2, 'friendly_name': 'Sensor', 'unit_of_measurement': '°C'}
+
+
+class LastState:
+    def __init__(self, attributes):
+        self.state = attributes['temperature']
+        self.attributes = attributes
+
+
+class BenchSensor(ZiGateSensor):
+    writes = 0
+
+    def async_schedule_update_ha_state(self, force_refresh=False):
+        BenchSensor.writes += 1
+
+    async def async_get_last_state(self):
+        return LastState(ATTRIBUTES)
+
+
+async def legacy_restore(sensor):
+    """async_added_to_hass before the bulk restore"""
+    state = await sensor.async_get_last_state()
+    for attr in iter(state.attributes):
+        if attr != 'friendly_name':
+            sensor._attributes.update({attr: state.attributes[attr]})
+            sensor.async_schedule_update_ha_state()
+
+
+async def run(restore):
+    hass = StubHass(asyncio.get_event_loop())
+    zigate = ZiGate2HASS(hass)
+    sensors = [BenchSensor(zigate, 'sensor {}'.format(i), '{:04x}01'.format(i), 'temperature')
+               for i in range(SENSORS)]
+    BenchSensor.writes = 0
+    start = time.perf_counter()
+    for sensor in sensors:
+        await restore(sensor)
+        # hass writes the state of every entity once it is added
+        sensor.async_schedule_update_ha_state()
+    return BenchSensor.writes, time.perf_counter() - start
+
+
+def main():
+    loop = asyncio.get_event_loop()
+    for name, restore in (('before', legacy_restore), ('after', BenchSensor.async_added_to_hass)):
+        writes, elapsed = loop.run_until_complete(run(restore))
+        print('{:<7}: {:>6} state writes for {} sensors ({:.1f} per sensor), {:.1f} ms'.format(
+            name, writes, SENSORS, writes / SENSORS, 1000 * elapsed))
+
+
+if __name__ == '__main__':
+    main()
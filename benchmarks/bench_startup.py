@@ -0,0 +1,108 @@
+#! /usr/bin/python3
+"""
+Startup benchmark : time to set the component up, and time to the first
+frame received from the ZiGate
+
+The component is set up (against a stubbed hass) with an emulated WiFi
+ZiGate (tools/zigate_emulator.py), a command is sent as soon as setup
+returns, before the link is up, and its 0x8000 status is the first frame.
+
+Run from the repository root : python3 benchmarks/bench_startup.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+RUNS = 20
+
+
+class BenchConfig:
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+
+    def path(self, *path):
+        return os.path.join(self.config_dir, *path)
+
+
+class BenchBus:
+    def __init__(self):
+        self.listeners = []
+
+    def async_fire(self, event_type, event_data=None):
+        pass
+
+    def async_listen_once(self, event_type, listener):
+        self.listeners.append(listener)
+
+
+async def start(config_dir, port):
+    """One startup, returns (setup, first frame) durations in secs"""
+    from zigate_replay import StubHass
+    import zigate
+
+    loop = asyncio.get_event_loop()
+    hass = StubHass(loop)
+    hass.config = BenchConfig(config_dir)
+    hass.bus = BenchBus()
+    config = zigate.CONFIG_SCHEMA({zigate.DOMAIN: {'host': '127.0.0.1', 'port': port}})
+
+    start_time = time.perf_counter()
+    await zigate.async_setup(hass, config)
+    setup_time = time.perf_counter() - start_time
+
+    device = hass.data[zigate.DOMAIN]
+    # permit join, queued while the link is not up yet
+    device.send_data('0049', 'FFFC1E00')
+    while not device.stats.frames_received:
+        await asyncio.sleep(0)
+    first_frame_time = time.perf_counter() - start_time
+
+    # home assistant stop
+    for listener in hass.bus.listeners:
+        listener(None)
+    device.tx.clear()
+    return setup_time, first_frame_time
+
+
+async def bench():
+    start_time = time.perf_counter()
+    import zigate  # noqa: F401
+    import_time = time.perf_counter() - start_time
+
+    import argparse
+    from zigate_emulator import EmulatorProtocol
+
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(
+        lambda: EmulatorProtocol(argparse.Namespace(devices=1, rate=0)), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    results = []
+    with tempfile.TemporaryDirectory() as config_dir:
+        for _ in range(RUNS):
+            results.append(await start(config_dir, port))
+            await asyncio.sleep(0.01)
+    server.close()
+
+    print('component import     : {:.2f} ms'.format(1000 * import_time))
+    print('first setup          : {:.2f} ms  (imports pyzigate & the interpreter)'.format(
+        1000 * results[0][0]))
+    print('first frame          : {:.2f} ms'.format(1000 * results[0][1]))
+    setups = sorted(r[0] for r in results[1:])
+    frames = sorted(r[1] for r in results[1:])
+    print('setup (next runs)    : median {:.2f} ms'.format(1000 * setups[len(setups) // 2]))
+    print('first frame (next)   : median {:.2f} ms'.format(1000 * frames[len(frames) // 2]))
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    # every stop logs a connection loss
+    logging.getLogger('zigate').setLevel(logging.ERROR)
+    asyncio.get_event_loop().run_until_complete(bench())
@@ -7,8 +7,9 @@ from homeassistant.components.light import (
     ATTR_BRIGHTNESS, ATTR_COLOR_TEMP, ATTR_TRANSITION, ATTR_FLASH, FLASH_LONG,
     SUPPORT_BRIGHTNESS, SUPPORT_COLOR_TEMP, SUPPORT_FLASH, SUPPORT_TRANSITION,
     Light, PLATFORM_SCHEMA)
-from homeassistant.helpers.dispatcher import (dispatcher_connect, dispatcher_send)
-from homeassistant.const import (CONF_NAME, CONF_ADDRESS, STATE_UNKNOWN, CONF_TYPE)
+from homeassistant.core import callback
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.const import (CONF_NAME, CONF_ADDRESS, STATE_UNKNOWN, STATE_ON, CONF_TYPE)
 import homeassistant.helpers.config_validation as cv
 
 import voluptuous as vol
@@ -16,18 +17,25 @@ import voluptuous as vol
 DEPENDENCIES = ['zigate']
 
 from custom_components.zigate.const import *
+from custom_components.zigate.coordinators import get_coordinator
+from custom_components.zigate.entity import ZiGateDeviceEntity
 
 CONF_LIGHT_TYPE = 'light_type'
+# default transition, in 1/10 s
 CONF_FADE_SPEED = 'fade_speed'
 CONF_LIGHT_MANUFACTURER = 'manufacturer'
+CONF_GROUP = 'group'
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
+# a light is either a device (address) or a Zigbee group (group)
+PLATFORM_SCHEMA = vol.All(PLATFORM_SCHEMA.extend({
     vol.Required(CONF_NAME): cv.string,
-    vol.Required(CONF_ADDRESS): cv.string,
+    vol.Exclusive(CONF_ADDRESS, 'target'): cv.string,
+    vol.Exclusive(CONF_GROUP, 'target'): cv.string,
     vol.Required(CONF_LIGHT_TYPE, default='white'): cv.string,
     vol.Optional(CONF_LIGHT_MANUFACTURER, default=''): cv.string,
     vol.Optional(CONF_FADE_SPEED, default=0): cv.positive_int,
-})
+    vol.Optional(CONF_COORDINATOR): cv.string,
+}), cv.has_at_least_one_key(CONF_ADDRESS, CONF_GROUP))
 
 SUPPORTED_FEATURES = (SUPPORT_BRIGHTNESS | SUPPORT_TRANSITION)
 
@@ -41,46 +49,89 @@ Type:
 """
 
 
-def setup_platform(hass, config, add_devices, discovery_info=None):
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up the ZiGate lights."""
-    device = ZiGateLight(hass, config.get(CONF_NAME), config.get(CONF_ADDRESS),
-                          config.get(CONF_LIGHT_TYPE), config.get(CONF_LIGHT_MANUFACTURER),
-                          )
-    add_devices([device])
-
-
-class ZiGateLight(Light):
+    if discovery_info is not None:
+        # a device discovered by its interview (on/off & level clusters)
+        zigate = get_coordinator(hass, name=discovery_info.get(CONF_COORDINATOR))
+        addrep = discovery_info[CONF_ADDRESS]
+        async_add_entities([ZiGateLight(hass, zigate, discovery_info[CONF_NAME], addrep,
+                                        'white', '',
+                                        unique_id='{}.{}'.format(zigate.name, addrep))])
+        return
+    zigate = get_coordinator(hass, config.get(CONF_ADDRESS), config.get(CONF_COORDINATOR))
+    if CONF_GROUP in config:
+        device = ZiGateLight(hass, zigate, config.get(CONF_NAME), config.get(CONF_GROUP),
+                             config.get(CONF_LIGHT_TYPE), config.get(CONF_LIGHT_MANUFACTURER),
+                             config.get(CONF_FADE_SPEED), mode=ZGT_ADDRESS_MODE_GROUP)
+    else:
+        device = ZiGateLight(hass, zigate, config.get(CONF_NAME), config.get(CONF_ADDRESS),
+                             config.get(CONF_LIGHT_TYPE), config.get(CONF_LIGHT_MANUFACTURER),
+                             config.get(CONF_FADE_SPEED))
+    async_add_entities([device])
+
+
+class ZiGateLight(ZiGateDeviceEntity, Light, RestoreEntity):
     """Representation of a Zigbee light as seen by the ZiGate."""
-    _commands = {
-        'power': '0092',
-        'brightness': '0081',
-        'temperature': '00C0'
-    }
 
-    def __init__(self, hass, name, addrep, light_type, manufacturer):
+    def __init__(self, hass, zigate, name, addrep, light_type, manufacturer, fade_speed=0,
+                 mode=ZGT_ADDRESS_MODE_SHORT, unique_id=None):
         """Initialize the switch."""
         self._hass = hass
+        self._zigate = zigate
         self._name = name
         self._addrep = addrep
+        # configured lights have one too (a group or a device of a ZiGate)
+        self._unique_id = unique_id or '{}.{}'.format(zigate.name, addrep)
         self._light_type = light_type
+        self._fade_speed = fade_speed
         self._attributes = {}
-        self._command_address_part = "02" + addrep[:4] + "01" + addrep[4:]
+        # addrep is a group (e.g. 0001) with mode ZGT_ADDRESS_MODE_GROUP
+        self._mode = mode
+        self._addr = int(addrep[:4], 16)
+        self._endpoint = int(addrep[4:] or '00', 16)
 
         self._state = False
         self._brightness = None
         self._temperature = None
-        self._available = True
+        # switched off by a fade out : off at its minimum level
+        self._faded_out = False
 
         self._features = SUPPORTED_FEATURES
         if self._light_type == "dual-white":
             self._features |= SUPPORT_COLOR_TEMP
 
-        dispatcher_connect(hass, ZGT_SIGNAL_UPDATE.format(self._addrep), self.update_attributes)
+        # groups don't report, their state is the last one commanded
+        if mode != ZGT_ADDRESS_MODE_GROUP:
+            # lights rarely report, their state is read periodically
+            zigate.poll(self._addrep, 0x0006, [0x0000])
+            zigate.poll(self._addrep, 0x0008, [0x0000])
+            if self._light_type == "dual-white":
+                zigate.poll(self._addrep, 0x0300, [0x0007])
 
     @property
     def unique_id(self):
         """Return the ID of this light."""
-        return "{}.{}".format(self.__class__, self._addrep)
+        return self._unique_id
+
+    @property
+    def should_poll(self):
+        return False
+
+    async def async_added_to_hass(self):
+        """Restore the last state, written once by hass right after this."""
+        await super().async_added_to_hass()
+        state = await self.async_get_last_state()
+        if state:
+            self._state = state.state == STATE_ON
+            self._brightness = state.attributes.get(ATTR_BRIGHTNESS, self._brightness)
+        if self._mode != ZGT_ADDRESS_MODE_GROUP:
+            self.async_listen_device(self._addrep, self.update_attributes)
+
+    @property
+    def assumed_state(self):
+        """Return True for a group, its members are not polled."""
+        return self._mode == ZGT_ADDRESS_MODE_GROUP
 
     @property
     def name(self):
@@ -124,63 +175,79 @@ class ZiGateLight(Light):
         """Return the white value of this light between 0..255."""
         return None
 
-    @property
-    def state_attributes(self):
-        """Return optional state attributes."""
-        data = {}
-
-        return data
-
     @property
     def supported_features(self):
         """Flag supported features."""
         return self._features
 
     @staticmethod
-    def _dec2hex_str(value):
-        return "{0:0{1}x}".format(value, 2)
-
-    @staticmethod
-    def _convert_brightness(value):
+    def _convert_temperature(value):
         brightness_step = 255
         scaled_brightness = round(brightness_step*(value/100))
-        return "{0:0{1}x}".format(scaled_brightness + 256, 4)
+        return scaled_brightness + 256
+
+    def _transition(self, kwargs):
+        """Transition time of a command in 1/10 s, done by the light itself"""
+        if ATTR_TRANSITION in kwargs:
+            return max(0, min(0xffff, int(round(kwargs[ATTR_TRANSITION] * 10))))
+        return self._fade_speed
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         """Turns light on"""
+        zigate = self._zigate
+        transition = self._transition(kwargs)
         command_sent = False
+        # level & temperature commands are coalesced per light :
+        # while dragging a slider only the latest value goes to the radio
         if ATTR_BRIGHTNESS in kwargs:
             self._brightness = kwargs[ATTR_BRIGHTNESS]
-            self._hass.services.call('zigate', 'raw_command', {
-                'cmd': self._commands['brightness'],
-                'data': self._command_address_part + '01' + self._dec2hex_str(self._brightness) + '0000'
-            })
+            zigate.async_move_to_level(self._addr, self._endpoint, self._brightness,
+                                       transition, self._mode)
             command_sent = True
 
         if ATTR_COLOR_TEMP in kwargs:
             self._temperature = kwargs[ATTR_COLOR_TEMP]
-            self._hass.services.call('zigate', 'raw_command', {
-                'cmd': self._commands['temperature'],
-                'data': self._command_address_part + self._convert_brightness(self._temperature) + '0000'
-            })
+            zigate.async_move_to_colour_temperature(
+                self._addr, self._endpoint, self._convert_temperature(self._temperature),
+                transition, self._mode)
             command_sent = True
 
         if not command_sent:
-            self._hass.services.call('zigate', 'raw_command', {
-                'cmd': self._commands['power'],
-                'data': self._command_address_part + '01'
-            })
+            if transition or self._faded_out:
+                # (fade in) up to the last brightness : after a fade out the
+                # light is off at its minimum level, a plain on would stay there
+                zigate.async_move_to_level(self._addr, self._endpoint, self._brightness or 254,
+                                           transition, self._mode)
+            else:
+                zigate.async_on_off(self._addr, self._endpoint, True, self._mode)
         self._state = True
-        pass
+        self._faded_out = False
+        self.async_write_ha_state()
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         """Turns light off"""
-        self._hass.services.call('zigate', 'raw_command', {
-            'cmd': self._commands['power'],
-            'data': self._command_address_part + '00'
-        })
+        transition = self._transition(kwargs)
+        if transition:
+            # fade out, the light switches off at level 0 (move to level with on/off),
+            # its brightness is kept for the next turn on
+            self._zigate.async_move_to_level(self._addr, self._endpoint, 0, transition,
+                                             self._mode)
+        else:
+            self._zigate.async_on_off(self._addr, self._endpoint, False, self._mode)
         self._state = False
-        pass
-
-    def update_attributes(self, property_id, property_data):
-        _LOGGER.debug("Property update: {0}: {1}", property_id, property_data)
+        self._faded_out = bool(transition)
+        self.async_write_ha_state()
+
+    @callback
+    def update_attributes(self, attributes):
+        _LOGGER.debug("Properties update: %s", attributes)
+        self._attributes.update(attributes)
+        if ZGT_ATTR_ONOFF in attributes:
+            self._state = attributes[ZGT_ATTR_ONOFF]
+            if self._state:
+                # switched on by other means, at whatever level it has
+                self._faded_out = False
+        # a light off (e.g. faded out) has its minimum level, not the one to come back to
+        if ZGT_ATTR_LEVEL in attributes and self._state:
+            self._brightness = attributes[ZGT_ATTR_LEVEL]
+        self.async_write_ha_state()
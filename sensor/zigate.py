@@ -3,9 +3,10 @@ ZiGate platform for Zigbee sensors.
 """
 from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
-from homeassistant.helpers.dispatcher import (dispatcher_connect, dispatcher_send)
+from homeassistant.core import callback
 from homeassistant.helpers.restore_state import RestoreEntity
-from homeassistant.const import (CONF_NAME, CONF_ADDRESS, STATE_UNKNOWN, ATTR_FRIENDLY_NAME)
+from homeassistant.const import (CONF_NAME, CONF_ADDRESS, STATE_UNKNOWN, ATTR_FRIENDLY_NAME,
+                                 ATTR_UNIT_OF_MEASUREMENT)
 import homeassistant.helpers.config_validation as cv
 
 import asyncio
@@ -15,43 +16,100 @@ import voluptuous as vol
 DEPENDENCIES = ['zigate']
 
 from custom_components.zigate.const import *
+from custom_components.zigate.coordinators import get_coordinator
+from custom_components.zigate.entity import ZiGateDeviceEntity
+from custom_components.zigate.hysteresis import (ZiGateChangeFilter, threshold,
+                                                 DEFAULT_MAX_SILENCE)
 
 _LOGGER = logging.getLogger(__name__)
 
-CONF_DEFAULT_ATTR = 'default_state'
-CONF_DEFAULT_UNIT = 'default_unit'
+CONF_THRESHOLD = 'threshold'
+CONF_THRESHOLDS = 'thresholds'
+CONF_MAX_SILENCE = 'max_silence'
 
+# thresholds : 0.5 (absolute) or '2%' (relative), for all attributes or per attribute
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_NAME): cv.string,
     vol.Required(CONF_ADDRESS): cv.string,
     vol.Optional(CONF_DEFAULT_ATTR, default=''): cv.string,
     vol.Optional(CONF_DEFAULT_UNIT, default=''): cv.string,
+    vol.Optional(CONF_THRESHOLD, default=0): threshold,
+    vol.Optional(CONF_THRESHOLDS, default={}): {cv.string: threshold},
+    vol.Optional(CONF_MAX_SILENCE, default=DEFAULT_MAX_SILENCE): cv.positive_int,
+    vol.Optional(CONF_COORDINATOR): cv.string,
 })
 
 
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
+# key in the statistics, name (after the ZiGate name), unit
+# (histograms : their 99th percentile)
+ZGT_STATS_SENSORS = (
+    ('frames_per_second', 'frames received', 'frames/s'),
+    ('bytes_per_second', 'bytes received', 'B/s'),
+    ('decode_errors', 'decoding errors', None),
+    ('decode_time', 'decode time', 'ms'),
+    ('dispatch_time', 'dispatch time', 'ms'),
+    ('tx_queue_depth', 'transmit queue', None),
+    ('tx_ack_time', 'acknowledgement time', 'ms'),
+    ('tx_retransmits', 'retransmissions', None),
+)
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up the ZiGate sensors."""
-    device = ZiGateSensor(hass, config.get(CONF_NAME), config.get(CONF_ADDRESS), 
-                         config.get(CONF_DEFAULT_ATTR), config.get(CONF_DEFAULT_UNIT)
-                         )
-    add_entities([device])
+    if discovery_info is not None and CONF_ADDRESS in discovery_info:
+        # a device discovered by its interview, state & unit from its clusters
+        zigate = get_coordinator(hass, name=discovery_info.get(CONF_COORDINATOR))
+        addr = discovery_info[CONF_ADDRESS]
+        async_add_entities([ZiGateSensor(zigate, discovery_info[CONF_NAME], addr,
+                                         discovery_info.get(CONF_DEFAULT_ATTR, ''),
+                                         discovery_info.get(CONF_DEFAULT_UNIT, ''),
+                                         unique_id='{}.{}'.format(zigate.name, addr))])
+        return
+    if discovery_info is not None:
+        # statistics of the ZiGate itself
+        zigate = get_coordinator(hass, name=discovery_info.get(CONF_COORDINATOR))
+        async_add_entities([ZiGateStatsSensor(zigate, key, '{} {}'.format(zigate.name, name), unit)
+                      for key, name, unit in ZGT_STATS_SENSORS])
+        return
+
+    from pyzigate.zgt_parameters import ZGT_LAST_SEEN
+
+    change_filter = ZiGateChangeFilter(config.get(CONF_THRESHOLD), config.get(CONF_THRESHOLDS),
+                                       config.get(CONF_MAX_SILENCE),
+                                       config.get(CONF_DEFAULT_ATTR) or ZGT_LAST_SEEN)
+    zigate = get_coordinator(hass, config.get(CONF_ADDRESS), config.get(CONF_COORDINATOR))
+    device = ZiGateSensor(zigate, config.get(CONF_NAME), config.get(CONF_ADDRESS), 
+                         config.get(CONF_DEFAULT_ATTR), config.get(CONF_DEFAULT_UNIT),
+                         change_filter)
+    async_add_entities([device])
 
 
-class ZiGateSensor(RestoreEntity):
+class ZiGateSensor(ZiGateDeviceEntity, RestoreEntity):
     from pyzigate.zgt_parameters import ZGT_LAST_SEEN
     """Representation of a Zigbee sensor as seen by the Zigate."""
 
-    def __init__(self, hass, name, addr, default_attr=ZGT_LAST_SEEN, default_unit=None):
+    def __init__(self, zigate, name, addr, default_attr=ZGT_LAST_SEEN, default_unit=None,
+                 change_filter=None, unique_id=None):
         """Initialize the sensor."""
         from pyzigate.zgt_parameters import ZGT_LAST_SEEN
 
         self._name = name
         self._addr = addr
+        self._unique_id = unique_id
         self._default_attr = default_attr if default_attr != '' else ZGT_LAST_SEEN
         self._default_unit = default_unit if default_unit != '' else None
-        self._attributes = {}
-        dispatcher_connect(hass, ZGT_SIGNAL_UPDATE.format(self._addr), self.update_attributes)
+        if change_filter is None:
+            change_filter = ZiGateChangeFilter(state_attribute=self._default_attr)
+        self._filter = change_filter
+        # last known state until the device reports
+        self._zigate = zigate
+        self._attributes = zigate.cached_attributes(self._addr)
+
+    @property
+    def unique_id(self):
+        """Return the ID of a discovered sensor (configured ones have none)."""
+        return self._unique_id
 
     @property
     def should_poll(self):
@@ -76,9 +134,17 @@ class ZiGateSensor(RestoreEntity):
         """Return the state attributes."""
         return self._attributes
 
-    def update_attributes(self, property_id, property_data):
-        self._attributes[property_id] = property_data
-        self.schedule_update_ha_state()
+    @callback
+    def update_attributes(self, attributes):
+        """
+        All properties decoded for this device in one go, the state is
+        only written if one of them changed beyond its threshold
+        (attributes, e.g. last seen, are kept up to date anyway)
+        """
+        self._attributes.update(attributes)
+        if self._filter.changed(attributes):
+            self._filter.written(self._attributes)
+            self.async_write_ha_state()
 
 
     async def async_added_to_hass(self):
@@ -87,7 +153,51 @@ class ZiGateSensor(RestoreEntity):
         await super().async_added_to_hass()
         state = await self.async_get_last_state()
         if state:
-            for attr in iter(state.attributes):
-                if attr != ATTR_FRIENDLY_NAME:
-                    _LOGGER.info('{}: set attribute {} from last state: {}'.format(self._name, attr, state.attributes[attr]))
-                    self.update_attributes(attr, state.attributes[attr])
+            # all attributes at once, the state is written by hass
+            # right after this (no write of ours)
+            restored = {attr: value for attr, value in state.attributes.items()
+                        if attr not in (ATTR_FRIENDLY_NAME, ATTR_UNIT_OF_MEASUREMENT)}
+            _LOGGER.debug('%s: attributes restored from last state: %s', self._name, restored)
+            self._attributes.update(restored)
+            self._filter.written(self._attributes)
+        self.async_listen_device(self._addr, self.update_attributes, reports=True)
+
+
+class ZiGateStatsSensor(Entity):
+    """One of the statistics of the ZiGate pipeline."""
+
+    def __init__(self, zigate, key, name, unit):
+        self._zigate = zigate
+        self._key = key
+        self._name = name
+        self._unit = unit
+        self._state = None
+        self._attributes = None
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        return self._unit
+
+    @property
+    def device_state_attributes(self):
+        """Return the details of a histogram."""
+        return self._attributes
+
+    async def async_update(self):
+        """Read the statistics (computed at most once per second)."""
+        value = self._zigate.get_stats()[self._key]
+        if isinstance(value, dict):
+            self._state = value['p99_ms']
+            self._attributes = value
+        else:
+            self._state = value
@@ -1,10 +1,11 @@
 """
 ZiGate platform for Zigbee switches
 """
-from time import sleep
 from homeassistant.components.switch import (SwitchDevice, PLATFORM_SCHEMA)
-from homeassistant.helpers.dispatcher import (dispatcher_connect, dispatcher_send)
-from homeassistant.const import (CONF_NAME, CONF_ADDRESS, STATE_UNKNOWN, CONF_TYPE)
+from homeassistant.core import callback
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.const import (CONF_NAME, CONF_ADDRESS, STATE_UNKNOWN, STATE_ON, CONF_TYPE,
+                                 ATTR_FRIENDLY_NAME)
 import homeassistant.helpers.config_validation as cv
 
 import voluptuous as vol
@@ -12,21 +13,26 @@ import voluptuous as vol
 DEPENDENCIES = ['zigate']
 
 from custom_components.zigate.const import *
+from custom_components.zigate.coordinators import get_coordinator
+from custom_components.zigate.entity import ZiGateDeviceEntity
 
-CONF_DEFAULT_ATTR = 'default_state'
 CONF_INVERTED = 'inverted'
 CONF_AUTOTOGGLE_DELAY = 'autotoggle_delay'
+CONF_GROUP = 'group'
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
+# a switch is either a device (address) or a Zigbee group (group)
+PLATFORM_SCHEMA = vol.All(PLATFORM_SCHEMA.extend({
     vol.Required(CONF_NAME): cv.string,
-    vol.Required(CONF_ADDRESS): cv.string,
+    vol.Exclusive(CONF_ADDRESS, 'target'): cv.string,
+    vol.Exclusive(CONF_GROUP, 'target'): cv.string,
     vol.Optional(CONF_DEFAULT_ATTR, default='None'): cv.string,
     vol.Optional(CONF_TYPE, default=None): vol.Any(None,
                                                    ZGT_SWITCHTYPE_TOGGLE,
                                                    ZGT_SWITCHTYPE_MOMENTARY),
     vol.Optional(CONF_INVERTED, default=False): cv.boolean,
     vol.Optional(CONF_AUTOTOGGLE_DELAY, default=ZGT_AUTOTOGGLE_DELAY): cv.positive_int,
-})
+    vol.Optional(CONF_COORDINATOR): cv.string,
+}), cv.has_at_least_one_key(CONF_ADDRESS, CONF_GROUP))
 
 """
 types :
@@ -39,35 +45,89 @@ will switch back to previous state some seconds later
 """
 
 
-def setup_platform(hass, config, add_devices, discovery_info=None):
-    """Set up the ZiGate sensors."""
-    device = ZiGateSwitch(hass, config.get(CONF_NAME), config.get(CONF_ADDRESS), 
-                         config.get(CONF_DEFAULT_ATTR), config.get(CONF_TYPE),
-                         config.get(CONF_INVERTED), config.get(CONF_AUTOTOGGLE_DELAY)
-                         )
-    add_devices([device])
-
-
-class ZiGateSwitch(SwitchDevice):
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the ZiGate switches."""
+    if discovery_info is not None:
+        # a device discovered by its interview, following its on/off attribute
+        zigate = get_coordinator(hass, name=discovery_info.get(CONF_COORDINATOR))
+        addrep = discovery_info[CONF_ADDRESS]
+        async_add_entities([ZiGateSwitch(hass, zigate, discovery_info[CONF_NAME], addrep,
+                                         ZGT_ATTR_ONOFF, None, False, ZGT_AUTOTOGGLE_DELAY,
+                                         unique_id='{}.{}'.format(zigate.name, addrep))])
+        return
+    zigate = get_coordinator(hass, config.get(CONF_ADDRESS), config.get(CONF_COORDINATOR))
+    if CONF_GROUP in config:
+        device = ZiGateSwitch(hass, zigate, config.get(CONF_NAME), config.get(CONF_GROUP),
+                              config.get(CONF_DEFAULT_ATTR), config.get(CONF_TYPE),
+                              config.get(CONF_INVERTED), config.get(CONF_AUTOTOGGLE_DELAY),
+                              mode=ZGT_ADDRESS_MODE_GROUP)
+    else:
+        device = ZiGateSwitch(hass, zigate, config.get(CONF_NAME), config.get(CONF_ADDRESS), 
+                             config.get(CONF_DEFAULT_ATTR), config.get(CONF_TYPE),
+                             config.get(CONF_INVERTED), config.get(CONF_AUTOTOGGLE_DELAY)
+                             )
+    async_add_entities([device])
+
+
+class ZiGateSwitch(ZiGateDeviceEntity, SwitchDevice, RestoreEntity):
     """Representation of a Zigbee switch as seen by the ZiGate."""
-    def __init__(self, hass, name, addrep, default_attr, switchtype, inverted, autotoggle_delay):
+    def __init__(self, hass, zigate, name, addrep, default_attr, switchtype, inverted, autotoggle_delay,
+                 mode=ZGT_ADDRESS_MODE_SHORT, unique_id=None):
         """Initialize the switch."""
         self._hass = hass
+        self._zigate = zigate
         self._name = name
         self._addrep = addrep
+        self._unique_id = unique_id
+        # addrep is a group (e.g. 0001) with mode ZGT_ADDRESS_MODE_GROUP
+        self._mode = mode
+        self._addr = int(addrep[:4], 16)
+        self._endpoint = int(addrep[4:] or '00', 16)
         self._default_attr = default_attr if default_attr != 'None' else None
         self._switchtype = switchtype
         self._inverted = inverted
-        self._attributes = {}
+        # last known attributes until the device reports
+        self._attributes = zigate.cached_attributes(addrep)
         self._state = False
         self._autotoggle_delay = autotoggle_delay
-        dispatcher_connect(hass, ZGT_SIGNAL_UPDATE.format(self._addrep),
-                           self.update_attributes)
+
+        # an on/off device (e.g. a plug) rarely reports, its state is read
+        # periodically like the lights, other switches follow the events they send
+        if mode != ZGT_ADDRESS_MODE_GROUP and self._default_attr == ZGT_ATTR_ONOFF:
+            zigate.poll(self._addrep, 0x0006, [0x0000])
+
+    @property
+    def unique_id(self):
+        """Return the ID of a discovered switch (configured ones have none)."""
+        return self._unique_id
 
     @property
     def should_poll(self):
         return False
 
+    async def async_added_to_hass(self):
+        """Restore the last state, written once by hass right after this."""
+        await super().async_added_to_hass()
+        state = await self.async_get_last_state()
+        if state:
+            self._state = state.state == STATE_ON
+            self._attributes.update({attr: value for attr, value in state.attributes.items()
+                                     if attr != ATTR_FRIENDLY_NAME})
+        # groups don't report, their state is the last one commanded
+        if self._mode != ZGT_ADDRESS_MODE_GROUP:
+            self.async_listen_device(self._addrep, self.update_attributes,
+                                     reports=self._default_attr not in (None, ZGT_ATTR_ONOFF))
+
+    async def async_will_remove_from_hass(self):
+        """Stop listening to the device, and drop a pending auto off."""
+        await super().async_will_remove_from_hass()
+        self._zigate.timers.cancel(self)
+
+    @property
+    def assumed_state(self):
+        """Return True for a group, its members are not polled."""
+        return self._mode == ZGT_ADDRESS_MODE_GROUP
+
     @property
     def name(self):
         """Return the name of the switch."""
@@ -78,28 +138,30 @@ class ZiGateSwitch(SwitchDevice):
         """Return the state attributes."""
         return self._attributes
 
-    def update_attributes(self, property_id, property_data):
+    @callback
+    def update_attributes(self, attributes):
         from pyzigate.zgt_parameters import ZGT_STATE_OFF, ZGT_EVENT_PRESENCE, ZGT_STATE_ON
 
-        self._attributes[property_id] = property_data
+        self._attributes.update(attributes)
 
+        # on/off attributes (ZGT_ATTR_ONOFF) are booleans
         if self._inverted is True:
-            on_states = [ZGT_STATE_OFF]
+            on_states = [ZGT_STATE_OFF, False]
         else:
-            on_states = [ZGT_EVENT_PRESENCE, ZGT_STATE_ON] 
+            on_states = [ZGT_EVENT_PRESENCE, ZGT_STATE_ON, True]
 
         # update the status on / off if appropriate
-        if property_id == self._default_attr:
+        if self._default_attr in attributes:
+            property_data = attributes[self._default_attr]
             if property_data in on_states:
                 if self._switchtype == ZGT_SWITCHTYPE_TOGGLE:
                     self._state = not self._state
                 elif self._switchtype == ZGT_SWITCHTYPE_MOMENTARY:
                     # switch back state after xx secs
-                    # no asyncio required as nthing expected during this time
+                    # a new event before that extends the delay
                     self._state = True
-                    self.schedule_update_ha_state()
-                    sleep(self._autotoggle_delay)
-                    self._state = False
+                    self._zigate.timers.schedule(
+                        self, self._autotoggle_delay, self._auto_off)
                 else:
                     self._state = True
             else:
@@ -110,27 +172,27 @@ class ZiGateSwitch(SwitchDevice):
                 else:
                     self._state = False
 
-        self.schedule_update_ha_state()
-    
+        self.async_write_ha_state()
+
+    @callback
+    def _auto_off(self):
+        """End of the momentary switch delay"""
+        self._state = False
+        self.async_write_ha_state()
+
     @property
     def is_on(self):
         """Return true if switch is on."""
         return self._state
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         """Turn the switch on."""
         self._state = True
         # Send the ON command
-        self._hass.services.call('zigate', 'raw_command', {
-            'cmd': '0092',
-            'data': "02{addr}01{ep}01".format(
-                addr=self._addrep[:4],
-                ep=self._addrep[-2:]
-            )
-        })
-        self.schedule_update_ha_state()
-
-    def turn_off(self, **kwargs):
+        self._zigate.async_on_off(self._addr, self._endpoint, True, self._mode)
+        self.async_write_ha_state()
+
+    async def async_turn_off(self, **kwargs):
         from pyzigate.zgt_parameters import ZGT_EVENT
         """Turn the device off."""
         # Disarm the activated event
@@ -138,11 +200,5 @@ class ZiGateSwitch(SwitchDevice):
             self._attributes[ZGT_EVENT] = None
         self._state = False
         # Send the OFF command
-        self._hass.services.call('zigate', 'raw_command', {
-            'cmd': '0092',
-            'data': "02{addr}01{ep}00".format(
-                addr=self._addrep[:4],
-                ep=self._addrep[-2:]
-            )
-        })
-        self.schedule_update_ha_state()
+        self._zigate.async_on_off(self._addr, self._endpoint, False, self._mode)
+        self.async_write_ha_state()
@@ -0,0 +1,5 @@
+"""Tests run from the repository root : python3 -m pytest tests"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,89 @@
+"""ZiGateFrameDecoder : chunks, escapes & bad frames"""
+from zigate.framing import ZiGateFrameDecoder, encode_frame
+
+# payload with bytes < 0x10, escaped on the wire
+PAYLOAD = bytes((0x02, 0xa1, 0xb2, 0x01, 0x01, 0x00, 0x03, 0x10))
+
+
+def message(msg_type, payload):
+    """Unescaped message as handed out by the decoder"""
+    decoded = ZiGateFrameDecoder().feed(encode_frame(msg_type, payload))
+    assert len(decoded) == 1
+    return decoded[0]
+
+
+def test_escaped_frame():
+    frame = encode_frame(0x8102, PAYLOAD)
+    # every byte < 0x10 of the message is escaped
+    assert b'\x00' not in frame[1:-1] and b'\x03' not in frame[1:-1]
+    decoded = message(0x8102, PAYLOAD)
+    assert decoded[:2] == b'\x81\x02'
+    assert decoded[2:4] == len(PAYLOAD).to_bytes(2, 'big')
+    assert decoded[5:] == PAYLOAD
+
+
+def test_split_anywhere():
+    frames = encode_frame(0x8102, PAYLOAD) + encode_frame(0x8000, b'\x00\x01\x00\x92')
+    expected = [message(0x8102, PAYLOAD), message(0x8000, b'\x00\x01\x00\x92')]
+    for cut in range(1, len(frames)):
+        decoder = ZiGateFrameDecoder()
+        assert decoder.feed(frames[:cut]) + decoder.feed(frames[cut:]) == expected
+        assert decoder.errors == 0
+
+
+def test_byte_by_byte():
+    frame = encode_frame(0x8102, PAYLOAD)
+    decoder = ZiGateFrameDecoder()
+    decoded = []
+    for i in range(len(frame)):
+        decoded += decoder.feed(frame[i:i + 1])
+    assert decoded == [message(0x8102, PAYLOAD)]
+
+
+def test_noise_between_frames():
+    decoder = ZiGateFrameDecoder()
+    decoded = decoder.feed(b'\xff\xfe' + encode_frame(0x8102, PAYLOAD) + b'\x42')
+    assert decoded == [message(0x8102, PAYLOAD)]
+
+
+def test_bad_checksum():
+    frame = bytearray(encode_frame(0x8102, PAYLOAD))
+    # the checksum follows the escaped type & length (0x81 0x02 0x00 0x08)
+    crc_pos = 1 + len(b'\x81\x02\x02\x10\x02\x18')
+    frame[crc_pos] ^= 0x40
+    decoder = ZiGateFrameDecoder()
+    assert decoder.feed(bytes(frame) + encode_frame(0x8000, b'\x00\x01\x00\x92')) == [
+        message(0x8000, b'\x00\x01\x00\x92')]
+    assert decoder.errors == 1
+
+
+def test_bad_length():
+    frame = encode_frame(0x8102, PAYLOAD)
+    decoder = ZiGateFrameDecoder()
+    # a byte lost on the line
+    assert decoder.feed(frame[:5] + frame[6:]) == []
+    assert decoder.errors == 1
+
+
+def test_truncated_frame():
+    frame = encode_frame(0x8102, PAYLOAD)
+    decoder = ZiGateFrameDecoder()
+    # the end of the first frame is lost, the next one is still decoded
+    assert decoder.feed(frame[:6] + frame) == [message(0x8102, PAYLOAD)]
+    assert decoder.errors == 1
+
+
+def test_oversized_frame():
+    decoder = ZiGateFrameDecoder(max_frame_size=16)
+    assert decoder.feed(b'\x01' + b'\x55' * 32 + b'\x03') == []
+    assert decoder.errors == 1
+    assert decoder.feed(encode_frame(0x8102, PAYLOAD)) == [message(0x8102, PAYLOAD)]
+
+
+def test_reset_drops_partial_frame():
+    frame = encode_frame(0x8102, PAYLOAD)
+    decoder = ZiGateFrameDecoder()
+    decoder.feed(frame[:7])
+    decoder.reset()
+    assert decoder.feed(frame[7:]) == []
+    assert decoder.feed(frame) == [message(0x8102, PAYLOAD)]
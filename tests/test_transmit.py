@@ -0,0 +1,156 @@
+"""ZiGateTransmitQueue : window, retries & coalescing, on a manual clock"""
+import heapq
+import itertools
+
+from zigate.transmit import ZiGateTransmitQueue, ZGT_PRIORITY_INTERACTIVE
+
+
+class FakeHandle:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """call_later / call_at on a clock moved by advance()"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        handle = FakeHandle()
+        heapq.heappush(self._timers, (when, next(self._sequence), handle, callback, args))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def advance(self, delay):
+        end = self.now + delay
+        while self._timers and self._timers[0][0] <= end:
+            when, _, handle, callback, args = heapq.heappop(self._timers)
+            self.now = when
+            if not handle.cancelled:
+                callback(*args)
+        self.now = end
+
+
+def make_queue(**options):
+    loop = FakeLoop()
+    written = []
+    tx = ZiGateTransmitQueue(loop, written.append, **options)
+    tx.resume()
+    return loop, tx, written
+
+
+def test_window():
+    loop, tx, written = make_queue(window=1)
+    tx.put(0x0092, b'on')
+    tx.put(0x0093, b'timed')
+    # only one command on the wire until its status comes back
+    assert written == [b'on']
+    tx.status_received(0, 0x0092)
+    assert written == [b'on', b'timed']
+    tx.status_received(0, 0x0093)
+    assert tx.size == 0
+
+
+def test_status_of_another_command_is_ignored():
+    loop, tx, written = make_queue(window=1)
+    tx.put(0x0092, b'on')
+    tx.put(0x0093, b'timed')
+    tx.status_received(0, 0x0081)
+    assert written == [b'on']
+
+
+def test_retry_on_timeout():
+    loop, tx, written = make_queue(timeout=2.0, retries=2)
+    tx.put(0x0092, b'on')
+    loop.advance(2.0)
+    loop.advance(2.0)
+    assert written == [b'on'] * 3
+    assert tx.retransmits == 2
+    # out of retries : dropped, the next command goes
+    tx.put(0x0093, b'timed')
+    loop.advance(2.0)
+    assert tx.dropped == 1
+    assert written[-1] == b'timed'
+
+
+def test_retry_when_busy():
+    loop, tx, written = make_queue()
+    tx.put(0x0092, b'on')
+    tx.status_received(4, 0x0092)
+    assert written == [b'on', b'on']
+    assert tx.retransmits == 1
+
+
+def test_coalescing():
+    loop, tx, written = make_queue(coalesce_interval=0.2)
+    key = (2, 0xa1b2, 1, 0x0081)
+    tx.put(0x0092, b'on')
+    tx.put(0x0081, b'level 1', key)
+    tx.put(0x0081, b'level 2', key)
+    tx.status_received(0, 0x0092)
+    # the newer level replaced the queued one
+    assert written == [b'on', b'level 2']
+    tx.status_received(0, 0x0081)
+    # sent less than the interval ago : held back, then only the latest goes
+    tx.put(0x0081, b'level 3', key)
+    tx.put(0x0081, b'level 4', key)
+    assert written == [b'on', b'level 2']
+    loop.advance(0.2)
+    assert written == [b'on', b'level 2', b'level 4']
+
+
+def test_discard_held():
+    loop, tx, written = make_queue(coalesce_interval=0.2)
+    key = (2, 0xa1b2, 1, 0x0081)
+    tx.put(0x0081, b'level 1', key, ZGT_PRIORITY_INTERACTIVE)
+    tx.status_received(0, 0x0081)
+    tx.put(0x0081, b'level 2', key, ZGT_PRIORITY_INTERACTIVE)
+    tx.discard((key,))
+    tx.put(0x0092, b'off', priority=ZGT_PRIORITY_INTERACTIVE)
+    loop.advance(1)
+    assert written == [b'level 1', b'off']
+    assert tx.size == 1
+
+
+def test_discard_queued():
+    loop, tx, written = make_queue()
+    key = (2, 0xa1b2, 1, 0x0081)
+    tx.put(0x0092, b'on')
+    tx.put(0x0081, b'level', key)
+    tx.discard((key,))
+    tx.status_received(0, 0x0092)
+    assert written == [b'on']
+    assert tx.size == 0
+
+
+def test_discard_inflight_is_not_resent():
+    loop, tx, written = make_queue(timeout=2.0, retries=2)
+    key = (2, 0xa1b2, 1, 0x0081)
+    tx.put(0x0081, b'level', key)
+    tx.discard((key,))
+    loop.advance(2.0)
+    assert written == [b'level']
+    assert tx.retransmits == 0 and tx.dropped == 1
+
+
+def test_flush_held_keeps_order():
+    loop, tx, written = make_queue(coalesce_interval=0.2)
+    key = (2, 0xa1b2, 1, 0x0081)
+    tx.put(0x0081, b'level 1', key, ZGT_PRIORITY_INTERACTIVE)
+    tx.status_received(0, 0x0081)
+    tx.put(0x0081, b'level 2', key, ZGT_PRIORITY_INTERACTIVE)
+    tx.flush((key,))
+    tx.put(0x0092, b'on', priority=ZGT_PRIORITY_INTERACTIVE)
+    tx.status_received(0, 0x0081)
+    assert written == [b'level 1', b'level 2', b'on']
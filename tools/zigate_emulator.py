@@ -0,0 +1,290 @@
+#! /usr/bin/python3
+"""
+ZiGate emulator, to load test the integration without a radio
+
+Listens on TCP (like a WiFi ZiGate, use host / port in the zigate config)
+or on a pty (like a USB ZiGate, use the printed path as serial_port),
+answers every command with a 0x8000 status, answers active endpoint
+(0x0045), simple descriptor (0x0043) and read attribute (0x0100) requests,
+and sends attribute reports from N simulated devices at a given rate.
+
+Run from the repository root :
+    python3 tools/zigate_emulator.py --port 9999 --devices 300 --rate 50
+    python3 tools/zigate_emulator.py --pty --devices 300 --rate 50
+    python3 tools/zigate_emulator.py --bench --devices 1000 --rate 5000 --duration 10
+
+--bench runs the emulator and ZiGate2HASS (against a stubbed hass) in the
+same process and reports the latency between a report being written on
+the link and the entity update being dispatched.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from zigate.framing import ZiGateFrameDecoder, encode_frame  # noqa: E402
+
+_LOGGER = logging.getLogger('zigate.emulator')
+
+FIRST_ADDRESS = 0x1000
+ENDPOINT = 0x01
+PROFILE_HA = 0x0104
+DEVICE_ID = 0x5f01
+MANUFACTURER = b'LUMI'
+MODEL = b'lumi.weather'
+# cluster, attribute, zigbee type, value generator
+REPORTS = (
+    (0x0402, 0x0000, 0x29, lambda n: (1800 + n % 700).to_bytes(2, 'big', signed=True)),
+    (0x0405, 0x0000, 0x21, lambda n: (4000 + n % 3000).to_bytes(2, 'big')),
+    (0x0403, 0x0000, 0x29, lambda n: (990 + n % 40).to_bytes(2, 'big', signed=True)),
+)
+IN_CLUSTERS = (0x0000, 0x0003, 0x0402, 0x0403, 0x0405)
+OUT_CLUSTERS = (0x0004,)
+
+
+def attribute_message(msg_type, sequence, addr, endpoint, cluster, attribute, attr_type, data):
+    """0x8100 / 0x8102 attribute response / report"""
+    payload = (bytes((sequence,)) + addr.to_bytes(2, 'big') + bytes((endpoint,)) +
+               cluster.to_bytes(2, 'big') + attribute.to_bytes(2, 'big') +
+               bytes((0x00, attr_type)) + len(data).to_bytes(2, 'big') + data +
+               b'\xb4')  # rssi
+    return encode_frame(msg_type, payload)
+
+
+class ZiGateEmulator:
+    """The ZiGate side of a link, write is the function sending to the host"""
+
+    def __init__(self, devices, write):
+        self._devices = devices
+        self._write = write
+        self._decoder = ZiGateFrameDecoder()
+        self._sequence = 0
+        self._reports = 0
+        self.commands = 0
+        # addr -> time the last report of this device was written
+        self.sent_at = {}
+
+    def _next_sequence(self):
+        self._sequence = (self._sequence + 1) & 0xff
+        return self._sequence
+
+    def data_received(self, data):
+        for frame in self._decoder.feed(data):
+            self.commands += 1
+            self._handle(((frame[0] << 8) | frame[1]), frame[5:])
+
+    def _handle(self, cmd, payload):
+        sequence = self._next_sequence()
+        self._write(encode_frame(0x8000, bytes((0x00, sequence)) + cmd.to_bytes(2, 'big')))
+
+        if cmd == 0x0045 and len(payload) >= 2:
+            # active endpoints
+            self._write(encode_frame(0x8045, bytes((sequence, 0x00)) + payload[:2] +
+                                     bytes((1, ENDPOINT))))
+        elif cmd == 0x0043 and len(payload) >= 3:
+            # simple descriptor
+            descriptor = (bytes((payload[2],)) + PROFILE_HA.to_bytes(2, 'big') +
+                          DEVICE_ID.to_bytes(2, 'big') + b'\x01' +
+                          bytes((len(IN_CLUSTERS),)) +
+                          b''.join(c.to_bytes(2, 'big') for c in IN_CLUSTERS) +
+                          bytes((len(OUT_CLUSTERS),)) +
+                          b''.join(c.to_bytes(2, 'big') for c in OUT_CLUSTERS))
+            self._write(encode_frame(0x8043, bytes((sequence, 0x00)) + payload[:2] +
+                                     bytes((len(descriptor),)) + descriptor))
+        elif cmd == 0x0100 and len(payload) >= 12:
+            # read attributes : mode, addr, src ep, dst ep, cluster, direction,
+            # manufacturer specific, manufacturer id, count, attributes
+            addr = int.from_bytes(payload[1:3], 'big')
+            endpoint = payload[4]
+            cluster = int.from_bytes(payload[5:7], 'big')
+            for i in range(payload[11]):
+                attribute = int.from_bytes(payload[12 + 2 * i:14 + 2 * i], 'big')
+                if cluster == 0x0000 and attribute == 0x0004:
+                    value = (0x42, MANUFACTURER)
+                elif cluster == 0x0000 and attribute == 0x0005:
+                    value = (0x42, MODEL)
+                else:
+                    value = (0x21, b'\x00\x00')
+                self._write(attribute_message(0x8100, sequence, addr, endpoint, cluster,
+                                              attribute, value[0], value[1]))
+
+    def send_reports(self, count):
+        """Write the next count attribute reports"""
+        frames = []
+        now = time.perf_counter()
+        for _ in range(count):
+            n = self._reports
+            self._reports += 1
+            addr = FIRST_ADDRESS + n % self._devices
+            cluster, attribute, attr_type, value = REPORTS[(n // self._devices) % len(REPORTS)]
+            frames.append(attribute_message(0x8102, self._next_sequence(), addr, ENDPOINT,
+                                            cluster, attribute, attr_type, value(n)))
+            self.sent_at[addr] = now
+        self._write(b''.join(frames))
+        return count
+
+
+async def generate_reports(emulator, rate, duration=None):
+    """Send reports at rate per second (for duration secs, or forever)"""
+    start = time.perf_counter()
+    sent = 0
+    while duration is None or time.perf_counter() - start < duration:
+        due = int((time.perf_counter() - start) * rate) - sent
+        if due > 0:
+            sent += emulator.send_reports(due)
+        await asyncio.sleep(0.005)
+    return sent
+
+
+class EmulatorProtocol(asyncio.Protocol):
+    """TCP server side of the emulator"""
+
+    def __init__(self, args):
+        self._args = args
+        self._emulator = None
+        self._task = None
+
+    def connection_made(self, transport):
+        _LOGGER.info('Client connected')
+        self._emulator = ZiGateEmulator(self._args.devices, transport.write)
+        if self._args.rate:
+            self._task = asyncio.ensure_future(generate_reports(self._emulator, self._args.rate))
+
+    def data_received(self, data):
+        self._emulator.data_received(data)
+
+    def connection_lost(self, exc):
+        _LOGGER.info('Client disconnected (%s commands received)', self._emulator.commands)
+        if self._task is not None:
+            self._task.cancel()
+
+
+async def serve_tcp(args):
+    server = await asyncio.get_event_loop().create_server(
+        lambda: EmulatorProtocol(args), args.host, args.port)
+    print('ZiGate emulator listening on {}:{}'.format(args.host, args.port))
+    await server.wait_closed()
+
+
+async def serve_pty(args):
+    import tty
+    loop = asyncio.get_event_loop()
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print('ZiGate emulator serial port : {}'.format(os.ttyname(slave)))
+
+    def write(data):
+        while data:
+            data = data[os.write(master, data):]
+
+    emulator = ZiGateEmulator(args.devices, write)
+
+    def read():
+        try:
+            emulator.data_received(os.read(master, 4096))
+        except OSError:
+            pass
+
+    loop.add_reader(master, read)
+    if args.rate:
+        await generate_reports(emulator, args.rate)
+    else:
+        await asyncio.Event().wait()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def bench(args):
+    """Emulator + ZiGate2HASS over a local TCP link"""
+    from homeassistant.core import callback
+    from zigate.zigate2hass import ZiGateProtocol, ZiGate2HASS
+    from zigate_replay import StubHass
+
+    loop = asyncio.get_event_loop()
+    emulators = []
+
+    def emulator_factory():
+        protocol = EmulatorProtocol(argparse.Namespace(devices=args.devices, rate=0))
+        emulators.append(protocol)
+        return protocol
+
+    server = await loop.create_server(emulator_factory, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    hass = StubHass(loop)
+    zigate = ZiGate2HASS(hass, update_window=0, max_size=args.devices + 16)
+    hass.data['zigate'] = zigate
+    latencies = []
+
+    for i in range(args.devices):
+        addr = FIRST_ADDRESS + i
+
+        @callback
+        def update(attributes, addr=addr):
+            sent_at = emulator.sent_at.pop(addr, None)
+            if sent_at is not None:
+                latencies.append(time.perf_counter() - sent_at)
+
+        zigate.register_entity('{:04x}{:02x}'.format(addr, ENDPOINT), update)
+
+    transport, _ = await loop.create_connection(lambda: ZiGateProtocol(zigate), '127.0.0.1', port)
+    zigate.bind_transport(transport)
+    await asyncio.sleep(0.1)
+    emulator = emulators[0]._emulator
+
+    # some commands on the way, acknowledged by the emulator
+    for i in range(args.devices):
+        zigate.async_read_attribute(FIRST_ADDRESS + i, ENDPOINT, 0x0000, [0x0005])
+
+    sent = await generate_reports(emulator, args.rate, args.duration)
+    await asyncio.sleep(0.5)
+    transport.close()
+    server.close()
+
+    latencies.sort()
+    print('reports sent     : {} ({:.0f}/s)'.format(sent, sent / args.duration))
+    print('updates received : {}'.format(len(latencies)))
+    print('commands acked   : {}'.format(emulator.commands))
+    if latencies:
+        print('latency (ms)     : p50 {:.2f}  p90 {:.2f}  p99 {:.2f}  max {:.2f}'.format(
+            *[1000 * percentile(latencies, p) for p in (50, 90, 99, 100)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='TCP address (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=9999, help='TCP port (default 9999)')
+    parser.add_argument('--pty', action='store_true', help='emulate a serial ZiGate on a pty')
+    parser.add_argument('--devices', type=int, default=100, help='number of simulated devices')
+    parser.add_argument('--rate', type=float, default=10,
+                        help='attribute reports per second, all devices together')
+    parser.add_argument('--bench', action='store_true',
+                        help='measure the integration latency in process')
+    parser.add_argument('--duration', type=float, default=10, help='--bench duration (secs)')
+    parser.add_argument('--debug', action='store_true', help='enable debug logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    if args.bench:
+        # pyzigate logs every attribute at info level
+        logging.getLogger('zigate').setLevel(logging.WARNING)
+        coro = bench(args)
+    elif args.pty:
+        coro = serve_pty(args)
+    else:
+        coro = serve_tcp(args)
+    try:
+        asyncio.get_event_loop().run_until_complete(coro)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
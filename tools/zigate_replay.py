@@ -0,0 +1,164 @@
+#! /usr/bin/python3
+"""
+Replay a ZiGate capture (see the capture_file option) through
+ZiGateProtocol / ZiGate2HASS against a stubbed hass, and report the
+decode + dispatch throughput.
+
+Every device found in the capture gets a (counting) entity registered,
+so the dispatch cost is the one of a fully configured installation.
+
+Run from the repository root :
+    python3 tools/zigate_replay.py capture.bin            # as fast as possible
+    python3 tools/zigate_replay.py capture.bin --realtime # original timing
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from homeassistant.core import callback, is_callback  # noqa: E402
+from zigate.capture import read_capture  # noqa: E402
+from zigate.framing import ZiGateFrameDecoder  # noqa: E402
+from zigate.zigate2hass import ZiGateProtocol, ZiGate2HASS  # noqa: E402
+
+ATTRIBUTE_REPORTS = (b'\x81\x00', b'\x81\x02')
+
+
+class StubStates:
+    def async_set(self, entity_id, state, attributes=None):
+        pass
+
+
+class StubServices:
+    def async_register(self, domain, service, service_func, schema=None):
+        pass
+
+    async def async_call(self, domain, service, service_data=None, blocking=False):
+        pass
+
+
+class StubBus:
+    def async_fire(self, event_type, event_data=None):
+        pass
+
+    def async_listen_once(self, event_type, listener):
+        pass
+
+
+class StubHass:
+    """Just enough of hass for ZiGate2HASS"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.data = {}
+        self.states = StubStates()
+        self.services = StubServices()
+        self.bus = StubBus()
+
+    def async_add_job(self, target, *args):
+        if asyncio.iscoroutine(target):
+            return self.loop.create_task(target)
+        if is_callback(target):
+            return target(*args)
+        return self.loop.run_in_executor(None, target, *args)
+
+    def add_job(self, target, *args):
+        self.loop.call_soon_threadsafe(self.async_add_job, target, *args)
+
+
+class StubTransport:
+    def write(self, data):
+        pass
+
+
+class ReplayZiGate(ZiGate2HASS):
+    """ZiGate2HASS counting the frames it interprets"""
+
+    frames = 0
+
+    def decode_data(self, data, calls=None):
+        self.frames += 1
+        super().decode_data(data, calls)
+
+
+def find_devices(records):
+    """Address + endpoint of every device reporting attributes in the capture"""
+    decoder = ZiGateFrameDecoder()
+    devices = set()
+    for _, data in records:
+        for frame in decoder.feed(data):
+            if frame[0:2] in ATTRIBUTE_REPORTS and len(frame) >= 9:
+                devices.add(frame[6:9].hex())
+    return devices
+
+
+async def replay(records, realtime, speed):
+    loop = asyncio.get_event_loop()
+    hass = StubHass(loop)
+    zigate = ReplayZiGate(hass, update_window=0)
+    hass.data['zigate'] = zigate
+    zigate.bind_transport(StubTransport())
+
+    updates = [0]
+
+    @callback
+    def update(attributes):
+        updates[0] += 1
+
+    devices = find_devices(records)
+    for addrep in devices:
+        zigate.register_entity(addrep, update)
+
+    protocol = ZiGateProtocol(zigate)
+    protocol.connection_made(StubTransport())
+    total = sum(len(data) for _, data in records)
+
+    start = time.perf_counter()
+    if realtime:
+        first = records[0][0] if records else 0
+        for timestamp, data in records:
+            delay = (timestamp - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            protocol.data_received(data)
+    else:
+        for _, data in records:
+            protocol.data_received(data)
+    elapsed = time.perf_counter() - start
+
+    print('devices      : {}'.format(len(devices)))
+    print('chunks       : {}'.format(len(records)))
+    print('bytes        : {}'.format(total))
+    print('frames       : {} ({} decoding errors)'.format(zigate.frames, protocol.decoder.errors))
+    print('updates      : {}'.format(updates[0]))
+    print('elapsed      : {:.3f} s'.format(elapsed))
+    if elapsed > 0:
+        print('throughput   : {:.0f} frames/s, {:.2f} MB/s'.format(
+            zigate.frames / elapsed, total / elapsed / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='capture file written by the capture_file option')
+    parser.add_argument('--realtime', action='store_true',
+                        help='replay with the original timing instead of as fast as possible')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='speed factor for --realtime (default 1)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='replay the capture N times')
+    parser.add_argument('--debug', action='store_true', help='enable debug logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    records = list(read_capture(args.capture)) * args.repeat
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(replay(records, args.realtime, args.speed))
+
+
+if __name__ == '__main__':
+    main()
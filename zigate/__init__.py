@@ -2,21 +2,26 @@
 Support for ZiGate
 """
 
-import asyncio
 import logging
-try:
-    # Valid since HomeAssistant 0.66+
-    from homeassistant.util import async_ as hasync
-except ImportError:
-    # backwards compatibility, with workaround to avoid reserved word "async"
-    # from homeassistant.util import async as hasync  # <- invalid syntax in Python 3.7
-    import importlib
-    hasync = importlib.import_module("homeassistant.util.async")
 
 import homeassistant.helpers.config_validation as cv
-from homeassistant.const import (CONF_NAME, CONF_HOST, CONF_PORT)
+from homeassistant.helpers import discovery
+from homeassistant.const import (CONF_NAME, CONF_HOST, CONF_PORT, CONF_ADDRESS,
+                                 EVENT_HOMEASSISTANT_STOP)
+from homeassistant.core import callback
+from homeassistant.util import slugify
 import voluptuous as vol
 from functools import partial
+from .const import (ZGT_UPDATE_WINDOW, ZGT_CHANNEL, ZGT_DEFAULT_NAME, ZGT_ADDRESS_MODE_GROUP,
+                    CONF_COORDINATOR)
+from .coordinators import ZGT_DATA_COORDINATORS, get_coordinator
+from .transmit import (DEFAULT_TX_QUEUE_SIZE, DEFAULT_TX_WINDOW,
+                       DEFAULT_TX_TIMEOUT, DEFAULT_TX_RETRIES,
+                       DEFAULT_COALESCE_INTERVAL, DEFAULT_TX_MAX_AGE,
+                       DEFAULT_TX_STARVATION_DELAY, ZGT_PRIORITY_NAMES)
+from .poller import DEFAULT_POLL_INTERVAL, DEFAULT_POLL_RATE
+from .interview import DEFAULT_INTERVIEW_CONCURRENCY, entity_platforms
+from .availability import DEFAULT_AVAILABILITY_TIMEOUT
 
 REQUIREMENTS = ['pyserial-asyncio==0.4', 'pyzigate==0.1.3.post1']
 
@@ -27,94 +32,319 @@ _LOGGER = logging.getLogger(__name__)
 
 CONF_BAUDRATE = 'baudrate'
 CONF_SERIAL_PORT = 'serial_port'
-DEFAULT_NAME = 'ZiGate'
+DEFAULT_NAME = ZGT_DEFAULT_NAME
 DEFAULT_SERIAL_PORT = '/dev/ttyUSB0'
 DEFAULT_BAUDRATE = 115200
 DEFAULT_HOST = ''
 DEFAULT_PORT = 9999
-DEFAULT_CHANNEL = '11'
+CONF_CHANNEL = 'channel'
+CONF_TX_QUEUE_SIZE = 'tx_queue_size'
+CONF_TX_WINDOW = 'tx_window'
+CONF_TX_TIMEOUT = 'tx_timeout'
+CONF_TX_RETRIES = 'tx_retries'
+CONF_COALESCE_INTERVAL = 'coalesce_interval'
+CONF_UPDATE_WINDOW = 'update_window'
+CONF_TX_MAX_AGE = 'tx_max_age'
+CONF_TX_STARVATION_DELAY = 'tx_starvation_delay'
+CONF_TX_RATE_LIMITS = 'tx_rate_limits'
+CONF_CAPTURE_FILE = 'capture_file'
+CONF_STATS_SENSORS = 'stats_sensors'
+CONF_POLL_INTERVAL = 'poll_interval'
+CONF_POLL_RATE = 'poll_rate'
+CONF_READER_THREAD = 'reader_thread'
+CONF_DISCOVERY = 'discovery'
+CONF_INTERVIEW_CONCURRENCY = 'interview_concurrency'
+CONF_AVAILABILITY_TIMEOUT = 'availability_timeout'
 
-CONFIG_SCHEMA = vol.Schema({
-    DOMAIN: vol.Schema({
+
+def _unique_names(coordinators):
+    names = [coordinator[CONF_NAME] for coordinator in coordinators]
+    if len(set(names)) != len(names):
+        raise vol.Invalid('each ZiGate needs its own name')
+    return coordinators
+
+
+# one ZiGate, or a list of them (each with its own name)
+COORDINATOR_SCHEMA = vol.Schema({
     vol.Optional(CONF_SERIAL_PORT, default=DEFAULT_SERIAL_PORT): cv.string,
     vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
     vol.Optional(CONF_BAUDRATE, default=DEFAULT_BAUDRATE): cv.positive_int,
     vol.Optional(CONF_HOST, default=DEFAULT_HOST): cv.string,
     vol.Optional(CONF_PORT, default=DEFAULT_PORT): cv.positive_int,
-    })
+    vol.Optional(CONF_CHANNEL, default=ZGT_CHANNEL): vol.All(vol.Coerce(int), vol.Range(min=11, max=26)),
+    vol.Optional(CONF_TX_QUEUE_SIZE, default=DEFAULT_TX_QUEUE_SIZE): cv.positive_int,
+    vol.Optional(CONF_TX_WINDOW, default=DEFAULT_TX_WINDOW): cv.positive_int,
+    vol.Optional(CONF_TX_TIMEOUT, default=DEFAULT_TX_TIMEOUT): vol.Coerce(float),
+    vol.Optional(CONF_TX_RETRIES, default=DEFAULT_TX_RETRIES): cv.positive_int,
+    vol.Optional(CONF_TX_MAX_AGE, default=DEFAULT_TX_MAX_AGE): cv.positive_int,
+    vol.Optional(CONF_TX_STARVATION_DELAY,
+                 default=DEFAULT_TX_STARVATION_DELAY): vol.Coerce(float),
+    # commands per second of a priority (interactive, config, background)
+    vol.Optional(CONF_TX_RATE_LIMITS, default={}): {
+        vol.In(ZGT_PRIORITY_NAMES): vol.All(vol.Coerce(float), vol.Range(min=0.01))},
+    vol.Optional(CONF_COALESCE_INTERVAL, default=DEFAULT_COALESCE_INTERVAL): vol.Coerce(float),
+    vol.Optional(CONF_UPDATE_WINDOW, default=ZGT_UPDATE_WINDOW): vol.Coerce(float),
+    vol.Optional(CONF_CAPTURE_FILE): cv.string,
+    vol.Optional(CONF_STATS_SENSORS, default=False): cv.boolean,
+    vol.Optional(CONF_POLL_INTERVAL, default=DEFAULT_POLL_INTERVAL): cv.positive_int,
+    vol.Optional(CONF_POLL_RATE, default=DEFAULT_POLL_RATE): vol.All(vol.Coerce(float),
+                                                                     vol.Range(min=0.01)),
+    vol.Optional(CONF_READER_THREAD, default=False): cv.boolean,
+    vol.Optional(CONF_DISCOVERY, default=True): cv.boolean,
+    vol.Optional(CONF_INTERVIEW_CONCURRENCY,
+                 default=DEFAULT_INTERVIEW_CONCURRENCY): vol.All(vol.Coerce(int),
+                                                                 vol.Range(min=1)),
+    # 0 : devices are always available
+    vol.Optional(CONF_AVAILABILITY_TIMEOUT,
+                 default=DEFAULT_AVAILABILITY_TIMEOUT): cv.positive_int,
+})
+
+CONFIG_SCHEMA = vol.Schema({
+    DOMAIN: vol.All(cv.ensure_list, [COORDINATOR_SCHEMA], _unique_names),
 }, extra=vol.ALLOW_EXTRA)
 
 
-@asyncio.coroutine
-def async_setup(hass, config):
+async def async_setup(hass, config):
     """ Setup the ZiGate platform """
-    import serial_asyncio
-    from .zigate2hass import ZiGateProtocol, ZiGate2HASS
-    from pyzigate.interface import ZiGate
+    # pyzigate & the interpreter are only imported once the component is set up
+    from .zigate2hass import ZiGate2HASS
+    from .connection import ZiGateConnection, ZGT_CONNECTION_STATE
+    from .registry import ZiGateRegistry, ZGT_REGISTRY_FILE
 
     _LOGGER.debug('ZIGATE : Starting')
 
-    # device interpreter
-    zigate = ZiGate2HASS(hass)
+    # every ZiGate has its own link, transmit queue & device table,
+    # the first one keeps the file & entity names of a single ZiGate setup
+    coordinators = hass.data[ZGT_DATA_COORDINATORS] = {}
+    connections = []
+    for index, zigate_config in enumerate(config[DOMAIN]):
+        name = zigate_config.get(CONF_NAME)
+        suffix = '' if index == 0 else '_' + slugify(name)
+
+        # devices known from previous runs, loaded before any entity is created
+        registry = ZiGateRegistry(hass, hass.config.path(
+            ZGT_REGISTRY_FILE if index == 0 else
+            ZGT_REGISTRY_FILE.replace('.json', suffix + '.json')))
+        await registry.async_load()
 
-    # Go through config and find all addresses of zigate devices
+        # device interpreter
+        zigate = ZiGate2HASS(hass,
+                             name=name,
+                             registry=registry,
+                             channel=zigate_config.get(CONF_CHANNEL),
+                             update_window=zigate_config.get(CONF_UPDATE_WINDOW),
+                             poll_interval=zigate_config.get(CONF_POLL_INTERVAL),
+                             poll_rate=zigate_config.get(CONF_POLL_RATE),
+                             interview_concurrency=zigate_config.get(CONF_INTERVIEW_CONCURRENCY),
+                             availability_timeout=zigate_config.get(CONF_AVAILABILITY_TIMEOUT),
+                             max_size=zigate_config.get(CONF_TX_QUEUE_SIZE),
+                             window=zigate_config.get(CONF_TX_WINDOW),
+                             timeout=zigate_config.get(CONF_TX_TIMEOUT),
+                             retries=zigate_config.get(CONF_TX_RETRIES),
+                             coalesce_interval=zigate_config.get(CONF_COALESCE_INTERVAL),
+                             max_age=zigate_config.get(CONF_TX_MAX_AGE),
+                             starvation_delay=zigate_config.get(CONF_TX_STARVATION_DELAY),
+                             rate_limits=zigate_config.get(CONF_TX_RATE_LIMITS))
+        coordinators[name] = zigate
+        if index == 0:
+            hass.data[DOMAIN] = zigate
+        for addr in registry.devices:
+            zigate.add_known_device(addr)
+
+        # pipeline statistics as sensors
+        if zigate_config.get(CONF_STATS_SENSORS):
+            hass.async_add_job(discovery.async_load_platform(
+                hass, 'sensor', DOMAIN, {CONF_STATS_SENSORS: True, CONF_COORDINATOR: name},
+                config))
+
+        # Asyncio serial connection to the device
+        # If HOST is configured, then connection is WiFi
+        if zigate_config.get(CONF_HOST) == "" and zigate_config.get(CONF_READER_THREAD):
+            # Serial, read & framed by a dedicated thread
+            from .reader import create_threaded_serial_connection
+            connect = partial(create_threaded_serial_connection, hass.loop,
+                              url=zigate_config.get(CONF_SERIAL_PORT),
+                              baudrate=zigate_config.get(CONF_BAUDRATE))
+        elif zigate_config.get(CONF_HOST) == "":
+            # Serial
+            import serial_asyncio
+            connect = partial(serial_asyncio.create_serial_connection, hass.loop,
+                              url=zigate_config.get(CONF_SERIAL_PORT),
+                              baudrate=zigate_config.get(CONF_BAUDRATE))
+        else:
+            # WiFi
+            connect = partial(hass.loop.create_connection,
+                              host=zigate_config.get(CONF_HOST),
+                              port=zigate_config.get(CONF_PORT))
+
+        # raw capture of the received data, to be replayed with tools/zigate_replay.py
+        capture = None
+        if zigate_config.get(CONF_CAPTURE_FILE):
+            from .capture import ZiGateCaptureWriter
+            capture = await hass.async_add_job(ZiGateCaptureWriter,
+                                               zigate_config.get(CONF_CAPTURE_FILE))
+
+        # the connection binds / unbinds the transport to the device interpreter
+        # and reconnects whenever the link is lost. It runs as a task on the loop :
+        # setup doesn't wait for the ZiGate, commands are buffered meanwhile
+        connections.append(ZiGateConnection(hass, zigate, connect, capture=capture,
+                                            state_entity=ZGT_CONNECTION_STATE + suffix))
+
+    # Go through config and find all addresses of zigate devices, with the
+    # ZiGate the platforms will pick (short addresses are per network)
     _LOGGER.debug('ZIGATE : Finding zigate addresses')
+    configured = set()
     for domain_config in config.keys():
         if domain_config in COMPONENT_TYPES:
             for platform_config in config[domain_config]:
                 if not isinstance(platform_config, str) and platform_config['platform'] == DOMAIN:
                     if 'address' in platform_config.keys():
-                        zigate.add_known_device(str(platform_config['address'])[:6])
+                        addrep = str(platform_config['address'])[:6].lower()
+                        zigate = get_coordinator(hass, addrep,
+                                                 platform_config.get(CONF_COORDINATOR))
+                        zigate.add_known_device(addrep)
+                        configured.add((zigate.name, addrep))
     _LOGGER.debug('ZIGATE : All known addresses added')
 
-    # Commands available as HASS services
+    # entities of the devices not in the configuration, from their clusters :
+    # the ones interviewed in previous runs now, the new ones once interviewed
+    # (coordinator name, address + endpoint) of the entities created
+    discovered = set()
+
+    @callback
+    def discover(zigate, addr, result):
+        if (zigate.name, addr) in configured:
+            return
+        model = result.get('model') or 'ZiGate device'
+        for endpoint, component, options in entity_platforms(result['endpoints']):
+            key = (zigate.name, addr + endpoint)
+            if key in configured or key in discovered:
+                continue
+            discovered.add(key)
+            info = {CONF_ADDRESS: addr + endpoint,
+                    CONF_NAME: '{} {}{}'.format(model, addr, endpoint),
+                    CONF_COORDINATOR: zigate.name}
+            info.update(options)
+            hass.async_add_job(discovery.async_load_platform(
+                hass, component, DOMAIN, info, config))
+
+    for zigate_config in config[DOMAIN]:
+        if not zigate_config.get(CONF_DISCOVERY):
+            continue
+        zigate = coordinators[zigate_config.get(CONF_NAME)]
+        for addr, device in zigate.registry.devices.items():
+            discover(zigate, addr, device)
+        zigate.interviewer.add_listener(partial(discover, zigate))
+
+    # Commands available as HASS services, sent to the ZiGate given
+    # as 'coordinator', or to all of them
+    def _targets(call):
+        name = call.data.get(CONF_COORDINATOR)
+        if name is None:
+            return list(coordinators.values())
+        if name not in coordinators:
+            _LOGGER.error('ZIGATE : Unknown coordinator %s', name)
+            return []
+        return [coordinators[name]]
+
+    # device services, addr is address + endpoint (e.g. a1b201), group e.g. 0001
+    def _device_target(call):
+        addrep = str(call.data.get('addr', ''))
+        if CONF_COORDINATOR in call.data:
+            zigates = _targets(call)
+        else:
+            # the ZiGate the device is paired with
+            zigates = [get_coordinator(hass, addrep)]
+        return zigates, int(addrep[:4], 16), int(addrep[4:6] or '01', 16)
+
     def permit_join(call):
         """Put ZiGate in Permit Join mode and register new devices"""
-        zigate.permit_join()
+        for zigate in _targets(call):
+            zigate.permit_join()
     
     def raw_command(call):
         """send a raw command to ZiGate"""
         cmd = call.data.get('cmd', '')
         data = call.data.get('data', '')
-        zigate.send_data(cmd, data)
+        for zigate in _targets(call):
+            zigate.send_data(cmd, data)
 
+    @callback
     def zigate_init(call):
-        channel = call.data.get('channel', DEFAULT_CHANNEL)
-        zigate.send_data('0021','0000%02x00' % int(channel)) # Channel
-        zigate.send_data('0023','00') # Coordinator
-        zigate.send_data('0024','') # Start network
+        # Channel, Coordinator, Start network
+        for zigate in _targets(call):
+            zigate.start_network(call.data.get('channel'))
+
+    @callback
+    def add_group(call):
+        """Add a device to a group, then ask for its groups"""
+        zigates, addr, endpoint = _device_target(call)
+        for zigate in zigates:
+            zigate.async_add_group(addr, endpoint, int(str(call.data.get('group')), 16))
+            zigate.async_get_group_membership(addr, endpoint)
+
+    @callback
+    def remove_group(call):
+        """Remove a device from a group, then ask for its groups"""
+        zigates, addr, endpoint = _device_target(call)
+        for zigate in zigates:
+            zigate.async_remove_group(addr, endpoint, int(str(call.data.get('group')), 16))
+            zigate.async_get_group_membership(addr, endpoint)
+
+    @callback
+    def view_groups(call):
+        """Notify the groups of a device"""
+        zigates, addr, endpoint = _device_target(call)
+        for zigate in zigates:
+            zigate.async_get_group_membership(addr, endpoint)
+
+    @callback
+    def timed_on(call):
+        """
+        Switch a device (addr) or a group (group) on for on_time secs,
+        it switches itself off afterwards (and stays off for off_wait_time secs)
+        """
+        def tenths(key):
+            return max(0, min(0xffff, int(round(float(call.data.get(key, 0)) * 10))))
+
+        if 'group' in call.data:
+            zigates = _targets(call)
+            args = (int(str(call.data['group']), 16), 0, tenths('on_time'),
+                    tenths('off_wait_time'), ZGT_ADDRESS_MODE_GROUP)
+        else:
+            zigates, addr, endpoint = _device_target(call)
+            args = (addr, endpoint, tenths('on_time'), tenths('off_wait_time'))
+        for zigate in zigates:
+            zigate.async_on_with_timed_off(*args)
+
+    @callback
+    def get_stats(call):
+        """Log the pipeline statistics and send them as zigate_stats events"""
+        for zigate in _targets(call):
+            stats = dict(zigate.get_stats(), coordinator=zigate.name)
+            _LOGGER.info('ZIGATE : Statistics %s', stats)
+            hass.bus.async_fire('zigate_stats', stats)
 
     hass.services.async_register(DOMAIN, 'permit_join', permit_join)
     hass.services.async_register(DOMAIN, 'raw_command', raw_command)
+    hass.services.async_register(DOMAIN, 'add_group', add_group)
+    hass.services.async_register(DOMAIN, 'remove_group', remove_group)
+    hass.services.async_register(DOMAIN, 'view_groups', view_groups)
+    hass.services.async_register(DOMAIN, 'timed_on', timed_on)
     hass.services.async_register(DOMAIN, 'init', zigate_init)
+    hass.services.async_register(DOMAIN, 'get_stats', get_stats)
 
-    # Asyncio serial connection to the device
-    # If HOST is configured, then connection is WiFi
-    if config[DOMAIN].get(CONF_HOST) is "":
-        # Serial
-        coro = serial_asyncio.create_serial_connection(hass.loop, ZiGateProtocol, 
-                                      config[DOMAIN].get(CONF_SERIAL_PORT),
-                                      baudrate=config[DOMAIN].get(CONF_BAUDRATE))
-    else:
-        # WiFi
-        coro = hass.loop.create_connection(ZiGateProtocol, 
-                                           host=config[DOMAIN].get(CONF_HOST),
-                                           port=config[DOMAIN].get(CONF_PORT))
-
-    future = hasync.run_coroutine_threadsafe(coro, hass.loop)
-    # bind connection to the device interpreter
-    future.add_done_callback(partial(bind_transport_to_device, zigate))
-    return True
-
-def bind_transport_to_device(device, protocol_refs):
-    """
-    Bind device and protocol / transport once they are ready
-    Update the device status @ start
-    """
-    transport = protocol_refs.result()[0]
-    protocol = protocol_refs.result()[1]
-    
-    protocol.device = device
-    device.send_to_transport = transport.write
-
+    @callback
+    def stop_connection(event):
+        # cancels the connection tasks as well
+        for connection in connections:
+            connection.stop()
+        for zigate in coordinators.values():
+            zigate.stop()
+            zigate.registry.async_save()
 
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_connection)
+    # not tracked by hass, connections run (and wait to reconnect) forever
+    for connection in connections:
+        connection.start()
+    return True
@@ -0,0 +1,106 @@
+"""
+Availability of the ZiGate devices
+
+Every frame from a device moves its deadline to now + its expected
+reporting interval, in a heap of deadlines (see timers.py) : O(log n)
+per frame, and nothing to do for devices that keep reporting.
+A device past its deadline is unavailable until its next frame, its
+entities are told in both cases. Devices are never polled for this : only
+the ones reporting by themselves or already polled have a deadline, a
+device only commanded from Home Assistant stays available.
+"""
+
+import logging
+
+from .timers import ZiGateTimers
+
+_LOGGER = logging.getLogger(__name__)
+
+# secs without a frame before a device is unavailable (battery devices
+# send at least a heartbeat per hour)
+DEFAULT_AVAILABILITY_TIMEOUT = 7200
+
+
+class ZiGateAvailability:
+    """Last seen time & availability of devices (short address, e.g. 'a1b2')"""
+
+    def __init__(self, loop, timeout=DEFAULT_AVAILABILITY_TIMEOUT):
+        self._loop = loop
+        self._timeout = timeout
+        self._timers = ZiGateTimers(loop)
+        # addr -> loop time of the last frame
+        self.last_seen = {}
+        # addr -> expected reporting interval, when not the default timeout
+        self._intervals = {}
+        # addr -> action of its deadline, addr -> [callback(available)]
+        self._actions = {}
+        self._listeners = {}
+        self._unavailable = set()
+        # devices with a deadline : reporting or polled
+        self._tracked = set()
+
+    def is_available(self, addr):
+        return addr not in self._unavailable
+
+    def expect(self, addr, interval):
+        """A device reports (or is read) at least every interval secs"""
+        known = self._intervals.get(addr)
+        if known is None or interval < known:
+            self._intervals[addr] = interval
+            self._track(addr, True)
+
+    def register(self, addr, listener, reports=False):
+        """
+        Call listener(available) when a device becomes (un)available,
+        returns a function removing it. Only devices that report (reports)
+        or are polled (expect) can become unavailable.
+        """
+        listeners = self._listeners.setdefault(addr, [])
+        listeners.append(listener)
+        if reports:
+            self._track(addr, False)
+
+        def unregister():
+            listeners.remove(listener)
+        return unregister
+
+    def seen(self, addr):
+        """A frame from a device (on the loop)"""
+        now = self.last_seen[addr] = self._loop.time()
+        if addr in self._tracked:
+            self._schedule(addr, now)
+        if addr in self._unavailable:
+            self._unavailable.discard(addr)
+            _LOGGER.info('ZIGATE : Device %s available again', addr)
+            self._notify(addr, True)
+
+    def stop(self):
+        self._timers.cancel_all()
+
+    def _track(self, addr, reschedule):
+        """Start the deadline of a device, or move it (reschedule, its interval changed)"""
+        tracked = addr in self._tracked
+        self._tracked.add(addr)
+        if addr in self._unavailable or (tracked and not reschedule):
+            return
+        # from its last frame, or now when not seen yet
+        self._schedule(addr, self.last_seen.get(addr, self._loop.time()))
+
+    def _schedule(self, addr, last_seen):
+        interval = self._intervals.get(addr, self._timeout)
+        if not interval:
+            return
+        action = self._actions.get(addr)
+        if action is None:
+            action = self._actions[addr] = lambda: self._expired(addr)
+        self._timers.schedule(addr, last_seen + interval - self._loop.time(), action)
+
+    def _expired(self, addr):
+        self._unavailable.add(addr)
+        _LOGGER.warning('ZIGATE : Device %s unavailable, nothing received for %s secs',
+                        addr, self._intervals.get(addr, self._timeout))
+        self._notify(addr, False)
+
+    def _notify(self, addr, available):
+        for listener in self._listeners.get(addr, ()):
+            listener(available)
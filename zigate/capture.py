@@ -0,0 +1,49 @@
+"""
+Raw capture of the ZiGate serial stream
+
+Every chunk received is stored as <timestamp:float64><length:uint32><data>
+(little endian, monotonic timestamp in secs) after an 8 bytes header,
+so production traffic can be replayed offline (see tools/zigate_replay.py).
+"""
+
+import logging
+import struct
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+ZGT_CAPTURE_MAGIC = b'ZGTCAP1\n'
+ZGT_CAPTURE_RECORD = struct.Struct('<dI')
+
+
+class ZiGateCaptureWriter:
+    """Append received chunks to a capture file"""
+
+    def __init__(self, path):
+        self._file = open(path, 'wb', buffering=65536)
+        self._file.write(ZGT_CAPTURE_MAGIC)
+        self._pack = ZGT_CAPTURE_RECORD.pack
+        _LOGGER.info('ZIGATE : Capturing serial data to %s', path)
+
+    def write(self, data):
+        self._file.write(self._pack(time.monotonic(), len(data)))
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+def read_capture(path):
+    """Yield the (timestamp, data) records of a capture file"""
+    with open(path, 'rb') as capture:
+        content = capture.read()
+    if not content.startswith(ZGT_CAPTURE_MAGIC):
+        raise ValueError('{} is not a ZiGate capture'.format(path))
+    pos = len(ZGT_CAPTURE_MAGIC)
+    size = ZGT_CAPTURE_RECORD.size
+    unpack = ZGT_CAPTURE_RECORD.unpack_from
+    while pos + size <= len(content):
+        timestamp, length = unpack(content, pos)
+        pos += size
+        yield timestamp, content[pos:pos + length]
+        pos += length
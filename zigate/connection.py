@@ -0,0 +1,157 @@
+"""
+ZiGate connection supervisor
+
+Opens the serial / TCP link, and re-opens it with exponential backoff
+(with jitter) when it is lost. Commands sent during the outage stay in
+the transmit queue and are replayed once the link is back.
+"""
+
+import asyncio
+import logging
+import random
+
+from .zigate2hass import ZiGateProtocol
+
+_LOGGER = logging.getLogger(__name__)
+
+ZGT_CONNECTION_STATE = 'zigate.connection'
+ZGT_CONNECT_TIMEOUT = 10
+DEFAULT_RECONNECT_MIN_DELAY = 1
+DEFAULT_RECONNECT_MAX_DELAY = 300
+# secs, how long stop() waits for a reader thread (its pending read is cancelled)
+ZGT_THREAD_JOIN_TIMEOUT = 2
+
+
+class ZiGateConnection:
+    """Keep the link between the ZiGate and its device interpreter up"""
+
+    def __init__(self, hass, device, connect,
+                 min_delay=DEFAULT_RECONNECT_MIN_DELAY,
+                 max_delay=DEFAULT_RECONNECT_MAX_DELAY, capture=None,
+                 state_entity=ZGT_CONNECTION_STATE):
+        """
+        connect is a coroutine function taking a protocol factory and
+        returning (transport, protocol), e.g. a partial of create_connection
+        capture is an optional ZiGateCaptureWriter for the received data
+        state_entity is the entity id publishing the connection state
+        """
+        self._hass = hass
+        self._device = device
+        self._connect = connect
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._capture = capture
+        self._state_entity = state_entity
+        self._transport = None
+        self._lost = None
+        self._stopped = False
+        self._disconnected_at = None
+        self._task = None
+        self._state_handle = None
+        self.reconnects = 0
+        self.last_outage = None
+        # the state shows the dropped commands as they happen
+        device.tx.drop_listener = self._schedule_state_update
+
+    @property
+    def connected(self):
+        return self._transport is not None
+
+    def _protocol_factory(self):
+        return ZiGateProtocol(self._device, self, self._capture)
+
+    def start(self):
+        """
+        Run the connection as a task of its own : hass doesn't wait for it
+        at startup, and stop() cancels it (even while waiting to reconnect)
+        """
+        self._task = self._hass.loop.create_task(self.async_run())
+
+    async def async_run(self):
+        """Connect, then reconnect whenever the link is lost"""
+        attempt = 0
+        while not self._stopped:
+            try:
+                transport, _ = await asyncio.wait_for(
+                    self._connect(self._protocol_factory), ZGT_CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as exc:
+                delay = min(self._max_delay, self._min_delay * 2 ** attempt)
+                delay *= random.uniform(0.5, 1)
+                attempt += 1
+                _LOGGER.warning('ZIGATE : Unable to connect (%s), retrying in %.1f s', exc, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            attempt = 0
+            self._lost = asyncio.Event()
+            self._transport = transport
+            if self._disconnected_at is not None:
+                self.reconnects += 1
+                self.last_outage = self._hass.loop.time() - self._disconnected_at
+                self._disconnected_at = None
+                _LOGGER.warning('ZIGATE : Reconnected after %.1f s', self.last_outage)
+                # network start goes first, then the commands queued meanwhile
+                self._device.start_network()
+            self._device.bind_transport(transport)
+            self._update_state()
+            if transport.is_closing():
+                # lost before we even got it
+                self.connection_lost(None)
+
+            await self._lost.wait()
+
+    def connection_lost(self, exc):
+        """Called by the protocol when the link is down"""
+        if self._transport is None or self._stopped:
+            # closed by stop() : nothing to report or reconnect
+            return
+        _LOGGER.warning('ZIGATE : Connection lost (%s)', exc)
+        self._transport = None
+        self._disconnected_at = self._hass.loop.time()
+        self._device.unbind_transport()
+        self._update_state()
+        self._lost.set()
+
+    def stop(self):
+        """Close the link for good"""
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._state_handle is not None:
+            self._state_handle.cancel()
+            self._state_handle = None
+        transport = self._transport
+        if transport is not None:
+            transport.close()
+        if self._capture is None:
+            return
+        if hasattr(transport, 'join'):
+            # a reader thread writes the capture until it is done with the port,
+            # waited for in the executor
+            self._hass.loop.run_in_executor(None, self._close_capture, transport)
+        else:
+            self._capture.close()
+
+    def _close_capture(self, transport):
+        """Close the capture once the reader thread is done (in the executor)"""
+        if transport.join(ZGT_THREAD_JOIN_TIMEOUT):
+            self._capture.close()
+        else:
+            _LOGGER.warning('ZIGATE : Reader thread still running, capture left open')
+
+    def _schedule_state_update(self):
+        """Update the state once for a burst of dropped commands"""
+        if self._state_handle is None:
+            self._state_handle = self._hass.loop.call_soon(self._update_state)
+
+    def _update_state(self):
+        if self._state_handle is not None:
+            self._state_handle.cancel()
+            self._state_handle = None
+        self._hass.states.async_set(
+            self._state_entity,
+            'connected' if self.connected else 'disconnected',
+            {'reconnects': self.reconnects,
+             'last_outage': None if self.last_outage is None else round(self.last_outage, 1),
+             'dropped_commands': self._device.tx.dropped})
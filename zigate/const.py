@@ -1,9 +1,31 @@
 # Const for zigate
 
-# 1 Signal channel for each device
-ZGT_SIGNAL_UPDATE = 'zgt_signal_update_{}'
 ZGT_SIGNAL_NEW_DEVICE = 'zgt_signal_new_device'
 
+# name of a ZiGate, and the option of entities & services choosing one
+ZGT_DEFAULT_NAME = 'ZiGate'
+CONF_COORDINATOR = 'coordinator'
+
+# default radio channel
+ZGT_CHANNEL = 11
+
+# properties decoded within this window (secs) are sent to entities as one update
+ZGT_UPDATE_WINDOW = 0.05
+
+# address modes of the commands
+ZGT_ADDRESS_MODE_GROUP = 0x01
+ZGT_ADDRESS_MODE_SHORT = 0x02
+ZGT_ADDRESS_MODE_BROADCAST = 0x04
+
+# light properties, decoded from on/off (0006), level (0008) & colour (0300) attributes
+ZGT_ATTR_ONOFF = 'onoff'
+ZGT_ATTR_LEVEL = 'level'
+ZGT_ATTR_COLOUR_TEMPERATURE = 'colour_temperature'
+
+# default state & unit of sensors (and state of switches), also given by discovery
+CONF_DEFAULT_ATTR = 'default_state'
+CONF_DEFAULT_UNIT = 'default_unit'
+
 # switches parameters
 ZGT_SWITCHTYPE_TOGGLE = 'toggle'
 ZGT_SWITCHTYPE_MOMENTARY = 'momentary'
@@ -0,0 +1,36 @@
+"""
+Several ZiGates (coordinators) on one site
+
+Each ZiGate has its own link, transmit queue & device table, entities
+are attached to the ZiGate their device is paired with.
+"""
+
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# name -> ZiGate2HASS, the first one is also hass.data['zigate']
+ZGT_DATA_COORDINATORS = 'zigate_coordinators'
+
+
+def get_coordinator(hass, addrep=None, name=None):
+    """
+    The ZiGate2HASS of a device (address + endpoint, e.g. 'a1b201') :
+    the one named, else the one whose registry knows the address,
+    else the first one
+    """
+    default = hass.data['zigate']
+    coordinators = hass.data.get(ZGT_DATA_COORDINATORS)
+    if not coordinators:
+        return default
+    if name is not None:
+        if name in coordinators:
+            return coordinators[name]
+        _LOGGER.error('ZIGATE : Unknown coordinator %s, using %s', name, default.name)
+        return default
+    if addrep and len(coordinators) > 1:
+        addr = addrep[:4].lower()
+        for zigate in coordinators.values():
+            if zigate.registry is not None and addr in zigate.registry.devices:
+                return zigate
+    return default
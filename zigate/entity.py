@@ -0,0 +1,49 @@
+"""
+Entities of ZiGate devices
+
+The lights, switches & sensors of a device share how they listen to it :
+the updates routed to them and the availability of the device.
+"""
+
+from homeassistant.core import callback
+
+
+class ZiGateDeviceEntity:
+    """
+    Mixin (before the hass entity class) of an entity of a ZiGate device,
+    self._zigate is its ZiGate2HASS
+    """
+
+    _available = True
+    # functions removing the routes of the device to this entity
+    _unregister = ()
+
+    def async_listen_device(self, addrep, update_callback, reports=False):
+        """
+        Route the updates of a device (address + endpoint, e.g. 'a1b201')
+        to update_callback, and follow its availability (reports : the
+        device reports by itself, see ZiGateAvailability.register)
+        """
+        addr = addrep[:4].lower()
+        availability = self._zigate.availability
+        self._available = availability.is_available(addr)
+        self._unregister = [
+            self._zigate.register_entity(addrep, update_callback),
+            availability.register(addr, self.update_availability, reports=reports)]
+
+    async def async_will_remove_from_hass(self):
+        """Stop listening to the device."""
+        await super().async_will_remove_from_hass()
+        for unregister in self._unregister:
+            unregister()
+        self._unregister = ()
+
+    @property
+    def available(self):
+        """Return False once the device stopped sending anything."""
+        return self._available
+
+    @callback
+    def update_availability(self, available):
+        self._available = available
+        self.async_write_ha_state()
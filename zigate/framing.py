@@ -0,0 +1,197 @@
+"""
+ZiGate serial framing
+
+A frame on the wire is 0x01 <escaped message> 0x03, where any byte < 0x10
+is sent as 0x02 followed by the byte xor'ed with 0x10.
+The unescaped message is <type:2><length:2><checksum:1><payload:length>.
+"""
+
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+ZGT_FRAME_START = 0x01
+ZGT_FRAME_ESCAPE = 0x02
+ZGT_FRAME_END = 0x03
+
+# no valid ZiGate message comes anywhere near this size,
+# a longer frame means we lost a delimiter on the line
+ZGT_FRAME_MAX_SIZE = 1024
+
+
+def frame_checksum(data, start=0):
+    """xor of all bytes from start (type, length & payload of a message)"""
+    crc = 0
+    for x in data[start:]:
+        crc ^= x
+    return crc
+
+
+class ZiGateFrameDecoder:
+    """
+    Incremental decoder for the ZiGate serial stream
+
+    Chunks can be split anywhere (even between an escape byte and the
+    escaped byte), the partial frame is kept in a reusable bytearray
+    and only complete, checksum-verified messages are handed out.
+    """
+
+    def __init__(self, max_frame_size=ZGT_FRAME_MAX_SIZE):
+        self._frame = bytearray()
+        self._in_frame = False
+        self._escape = False
+        self._max_frame_size = max_frame_size
+        self.errors = 0
+
+    def reset(self):
+        """Drop any partial frame (e.g. after the link was reset)"""
+        del self._frame[:]
+        self._in_frame = False
+        self._escape = False
+
+    def feed(self, data):
+        """
+        Decode a chunk received from the ZiGate
+        Returns the list of complete messages (type + length + checksum + payload)
+        """
+        frames = []
+        view = memoryview(data)
+        frame = self._frame
+        pos = 0
+        end = len(data)
+
+        while pos < end:
+            if not self._in_frame:
+                start = data.find(b'\x01', pos)
+                if start == -1:
+                    # noise between frames
+                    break
+                del frame[:]
+                self._in_frame = True
+                self._escape = False
+                pos = start + 1
+                continue
+
+            stop = data.find(b'\x03', pos)
+            restart = data.find(b'\x01', pos, end if stop == -1 else stop)
+            if restart != -1:
+                # a new frame starts before the current one ended
+                self.errors += 1
+                _LOGGER.debug('ZIGATE : Truncated frame dropped')
+                self._in_frame = False
+                pos = restart
+                continue
+            if stop == -1:
+                stop = end
+
+            # unescape data[pos:stop] into the frame buffer
+            if self._escape and pos < stop:
+                frame.append(data[pos] ^ 0x10)
+                self._escape = False
+                pos += 1
+            while pos < stop:
+                esc = data.find(b'\x02', pos, stop)
+                if esc == -1:
+                    frame += view[pos:stop]
+                    break
+                frame += view[pos:esc]
+                if esc + 1 < stop:
+                    frame.append(data[esc + 1] ^ 0x10)
+                    pos = esc + 2
+                else:
+                    self._escape = True
+                    break
+            pos = stop
+
+            if len(frame) > self._max_frame_size:
+                self.errors += 1
+                _LOGGER.debug('ZIGATE : Oversized frame dropped')
+                self._in_frame = False
+                continue
+
+            if stop < end:
+                # end of frame reached
+                pos = stop + 1
+                self._in_frame = False
+                if self._check(frame):
+                    frames.append(bytes(frame))
+
+        return frames
+
+    def _check(self, frame):
+        """Check length & checksum of an unescaped message"""
+        if len(frame) < 5 or self._escape:
+            self.errors += 1
+            _LOGGER.debug('ZIGATE : Frame too short')
+            return False
+        length = (frame[2] << 8) | frame[3]
+        if length != len(frame) - 5:
+            self.errors += 1
+            _LOGGER.debug('ZIGATE : Bad frame length %s != %s',
+                          length, len(frame) - 5)
+            return False
+        crc = frame[0] ^ frame[1] ^ frame[2] ^ frame[3] ^ frame_checksum(frame, 5)
+        if crc != frame[4]:
+            self.errors += 1
+            _LOGGER.debug('ZIGATE : Bad frame checksum %s != %s', crc, frame[4])
+            return False
+        return True
+
+
+# escaped form of every byte value, bytes < 0x10 are sent as 0x02, byte ^ 0x10
+_ESCAPED = [bytes((ZGT_FRAME_ESCAPE, x ^ 0x10)) if x < 0x10 else bytes((x,))
+            for x in range(256)]
+
+
+def frame_escape(data):
+    """Escape a message before sending it to the ZiGate"""
+    return b''.join([_ESCAPED[x] for x in data])
+
+
+def encode_frame(msg_type, payload=b''):
+    """
+    Build the complete frame for a message
+    msg_type is an int (e.g. 0x0092), payload the raw (unescaped) bytes
+    """
+    length = len(payload)
+    header = bytes((msg_type >> 8, msg_type & 0xff, length >> 8, length & 0xff))
+    crc = header[0] ^ header[1] ^ header[2] ^ header[3] ^ frame_checksum(payload)
+    return (b'\x01' + frame_escape(header) + _ESCAPED[crc] +
+            frame_escape(payload) + b'\x03')
+
+
+class ZiGateFrameTemplate:
+    """
+    Pre-encoded frame of a command sent over and over to the same device,
+    e.g. move to level : <type><length> and the fixed payload bytes
+    (destination...) are escaped & xor'ed once, only the variable bytes
+    (level, transition) are escaped per frame, and the checksum is the
+    cached xor ^ the xor of the variable bytes.
+    Complete frames of fixed values (on / off) are kept as well.
+    """
+
+    __slots__ = ('_head', '_fixed', '_crc', '_frames')
+
+    def __init__(self, msg_type, fixed, variable_length):
+        length = len(fixed) + variable_length
+        header = bytes((msg_type >> 8, msg_type & 0xff, length >> 8, length & 0xff))
+        self._head = b'\x01' + frame_escape(header)
+        self._fixed = frame_escape(fixed)
+        self._crc = frame_checksum(header) ^ frame_checksum(fixed)
+        # variable bytes -> complete frame
+        self._frames = {}
+
+    def frame(self, variable):
+        """Complete frame with these variable bytes"""
+        crc = self._crc
+        for x in variable:
+            crc ^= x
+        return b''.join([self._head, _ESCAPED[crc], self._fixed,
+                         *[_ESCAPED[x] for x in variable], b'\x03'])
+
+    def cached(self, variable):
+        """Same as frame(), built once for each value of the variable bytes"""
+        frame = self._frames.get(variable)
+        if frame is None:
+            frame = self._frames[variable] = self.frame(variable)
+        return frame
@@ -0,0 +1,75 @@
+"""
+Change detection for the ZiGate sensors
+
+Sensors resend unchanged values (and heartbeats) all the time, writing
+each of them in the state machine only grows the recorder. A state is
+written when an attribute changed more than its threshold since the last
+write, or when nothing was written for max_silence secs.
+"""
+
+import time
+
+from pyzigate.zgt_parameters import ZGT_LAST_SEEN
+
+DEFAULT_MAX_SILENCE = 3600
+
+# never a reason to write on their own (unless shown as the state)
+ZGT_IGNORED_ATTRIBUTES = (ZGT_LAST_SEEN,)
+
+
+def threshold(value):
+    """
+    Parse a threshold : '0.5' is absolute, '2%' is relative to the value
+    last written, returns (absolute, relative)
+    """
+    value = str(value).strip()
+    if value.endswith('%'):
+        return 0.0, abs(float(value[:-1])) / 100
+    return abs(float(value)), 0.0
+
+
+class ZiGateChangeFilter:
+    """
+    Decides whether an update of attributes is worth a state write
+    thresholds : attribute -> (absolute, relative), others use default
+    state_attribute : the attribute shown as the state, never ignored
+    """
+
+    def __init__(self, default=(0.0, 0.0), thresholds=None, max_silence=DEFAULT_MAX_SILENCE,
+                 state_attribute=None):
+        self._default = default
+        self._ignored = tuple(attr for attr in ZGT_IGNORED_ATTRIBUTES if attr != state_attribute)
+        self._thresholds = thresholds or {}
+        self._max_silence = max_silence
+        # attributes as last written & when
+        self._written = {}
+        self._written_at = None
+        self.suppressed = 0
+
+    def changed(self, attributes):
+        """True if one of the updated attributes changed enough"""
+        if self._written_at is None or time.monotonic() - self._written_at >= self._max_silence:
+            return True
+        written = self._written
+        for attr, value in attributes.items():
+            if attr in self._ignored:
+                continue
+            if attr not in written:
+                return True
+            previous = written[attr]
+            if value == previous:
+                continue
+            if (isinstance(value, (int, float)) and isinstance(previous, (int, float)) and
+                    not isinstance(value, bool) and not isinstance(previous, bool)):
+                absolute, relative = self._thresholds.get(attr, self._default)
+                if abs(value - previous) >= max(absolute, relative * abs(previous)):
+                    return True
+            else:
+                return True
+        self.suppressed += 1
+        return False
+
+    def written(self, attributes):
+        """The state was written with these attributes"""
+        self._written = dict(attributes)
+        self._written_at = time.monotonic()
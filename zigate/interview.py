@@ -0,0 +1,176 @@
+"""
+ZiGate device interview
+
+When a device joins, ask for its active endpoints (0x0045), the simple
+descriptor of each endpoint (0x0043), then its manufacturer & model
+(basic cluster attributes 0004 & 0005).
+Several devices are interviewed at once (up to `concurrency`), every
+step waits for its answer and is retried a few times, and the commands
+go through the transmit queue like any other, so a whole network joining
+again doesn't flood the radio.
+"""
+
+import asyncio
+import logging
+
+from pyzigate.zgt_parameters import (ZGT_TEMPERATURE, ZGT_HUMIDITY, ZGT_PRESSURE,
+                                     ZGT_ILLUMINANCE_MEASUREMENT, ZGT_EVENT)
+
+from .const import CONF_DEFAULT_ATTR, CONF_DEFAULT_UNIT
+from .transmit import ZGT_PRIORITY_CONFIG
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INTERVIEW_CONCURRENCY = 4
+DEFAULT_INTERVIEW_RETRIES = 3
+# secs to wait for an answer
+DEFAULT_INTERVIEW_TIMEOUT = 10
+
+# basic cluster attributes
+ZGT_ATTR_MANUFACTURER = 0x0004
+ZGT_ATTR_MODEL = 0x0005
+
+# measurement & occupancy clusters -> default state & unit of their sensor,
+# in order of preference for an endpoint with several of them
+# (illuminance is the raw measured value, 10000 * log10(lux) + 1)
+ZGT_SENSOR_CLUSTERS = (
+    ('0402', ZGT_TEMPERATURE, '°C'),
+    ('0405', ZGT_HUMIDITY, '%'),
+    ('0403', ZGT_PRESSURE, 'mb'),
+    ('0400', ZGT_ILLUMINANCE_MEASUREMENT, ''),
+    ('0406', ZGT_EVENT, ''),
+)
+
+
+def entity_platforms(endpoints):
+    """
+    (endpoint, platform, options) of the entities of an interviewed device,
+    from the input clusters of its endpoints ({endpoint: descriptor}),
+    options to add to the discovery info
+    """
+    for endpoint, descriptor in sorted(endpoints.items()):
+        clusters = descriptor.get('in_clusters', ())
+        if '0006' in clusters and '0008' in clusters:
+            yield endpoint, 'light', {}
+        elif '0006' in clusters:
+            yield endpoint, 'switch', {}
+        else:
+            for cluster, attr, unit in ZGT_SENSOR_CLUSTERS:
+                if cluster in clusters:
+                    yield endpoint, 'sensor', {CONF_DEFAULT_ATTR: attr, CONF_DEFAULT_UNIT: unit}
+                    break
+
+
+class ZiGateInterviewer:
+    """Interviews of the devices joining a ZiGate2HASS"""
+
+    def __init__(self, hass, device, concurrency=DEFAULT_INTERVIEW_CONCURRENCY,
+                 retries=DEFAULT_INTERVIEW_RETRIES, timeout=DEFAULT_INTERVIEW_TIMEOUT):
+        self._hass = hass
+        self._device = device
+        self._concurrency = concurrency
+        self._semaphore = None
+        self._retries = retries
+        self._timeout = timeout
+        # addr -> interview task
+        self._interviews = {}
+        # answer key -> future
+        self._waiting = {}
+        # addr -> basic attributes received so far
+        self._basic = {}
+        # functions called with (addr, result) once a device is interviewed
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def interviewing(self, addr):
+        return addr in self._interviews
+
+    def interview(self, addr):
+        """Interview a device (short address as hex string), unless already running"""
+        if addr in self._interviews:
+            return self._interviews[addr]
+        task = self._interviews[addr] = self._hass.async_add_job(self._async_interview(addr))
+        return task
+
+    async def _async_interview(self, addr):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        try:
+            async with self._semaphore:
+                result = await self._async_steps(addr)
+        except asyncio.TimeoutError:
+            _LOGGER.warning('ZIGATE : Interview of %s failed, no answer', addr)
+            return None
+        finally:
+            del self._interviews[addr]
+        _LOGGER.info('ZIGATE : Device %s interviewed : %s', addr, result)
+        for listener in self._listeners:
+            listener(addr, result)
+        return result
+
+    async def _async_steps(self, addr):
+        short_addr = int(addr, 16)
+        endpoints = await self._async_ask(
+            ('endpoints', addr),
+            lambda: self._device.send_frame(0x0045, short_addr.to_bytes(2, 'big')))
+        result = {'endpoints': {}, 'manufacturer': None, 'model': None}
+        for endpoint in endpoints:
+            result['endpoints'][endpoint] = await self._async_ask(
+                ('descriptor', addr, endpoint),
+                lambda: self._device.send_frame(
+                    0x0043, short_addr.to_bytes(2, 'big') + bytes((int(endpoint, 16),))))
+        for endpoint, descriptor in result['endpoints'].items():
+            if '0000' in descriptor.get('in_clusters', ()):
+                try:
+                    result.update(await self._async_ask(
+                        ('basic', addr),
+                        lambda: self._device.async_read_attribute(
+                            short_addr, int(endpoint, 16), 0x0000,
+                            [ZGT_ATTR_MANUFACTURER, ZGT_ATTR_MODEL], ZGT_PRIORITY_CONFIG)))
+                except asyncio.TimeoutError:
+                    # not worth failing the interview, the clusters are known
+                    result.update(self._basic.get(addr, {}))
+                finally:
+                    self._basic.pop(addr, None)
+                break
+        return result
+
+    async def _async_ask(self, key, send):
+        """Send a request until its answer comes (retries + 1 attempts)"""
+        for attempt in range(self._retries + 1):
+            future = self._waiting[key] = self._hass.loop.create_future()
+            send()
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self._timeout)
+            except asyncio.TimeoutError:
+                _LOGGER.debug('ZIGATE : No answer for %s (attempt %s)', key, attempt + 1)
+            finally:
+                if self._waiting.get(key) is future:
+                    del self._waiting[key]
+        raise asyncio.TimeoutError
+
+    def _answer(self, key, value):
+        future = self._waiting.get(key)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    # answers, from the ZiGate2HASS decoding (on the loop)
+
+    def endpoints_received(self, addr, endpoints):
+        self._answer(('endpoints', addr), endpoints)
+
+    def descriptor_received(self, addr, endpoint, descriptor):
+        self._answer(('descriptor', addr, endpoint), descriptor)
+
+    def basic_received(self, addr, attribute, value):
+        if ('basic', addr) not in self._waiting:
+            return
+        # both attributes arrive in their own message, the model ends the step
+        basic = self._basic.setdefault(addr, {})
+        if attribute == ZGT_ATTR_MANUFACTURER:
+            basic['manufacturer'] = value
+        elif attribute == ZGT_ATTR_MODEL:
+            basic['model'] = value
+            self._answer(('basic', addr), basic)
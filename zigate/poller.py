@@ -0,0 +1,117 @@
+"""
+ZiGate attribute polling
+
+Devices that don't report on their own (e.g. most lights) are read every
+interval secs. All the attributes of a cluster are asked in one read
+request, devices are spread over the interval with jitter, a device
+that reported during the interval is not read, and read requests leave
+at most `rate` per second, only when no other command is waiting.
+"""
+
+import logging
+import random
+from collections import deque
+from functools import partial
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 300
+DEFAULT_POLL_RATE = 2
+# +/- part of the interval
+ZGT_POLL_JITTER = 0.1
+
+
+class ZiGatePoller:
+    """Periodic attribute reads of a ZiGate2HASS devices"""
+
+    def __init__(self, loop, device, interval=DEFAULT_POLL_INTERVAL, rate=DEFAULT_POLL_RATE):
+        self._loop = loop
+        self._device = device
+        self._interval = interval
+        self._rate = rate
+        # address + endpoint (e.g. b'a1b201') -> {cluster: [attributes]}
+        self._targets = {}
+        # address + endpoint -> time of the last report received
+        self._seen = {}
+        # read requests due : (key, addr, endpoint, cluster, attributes)
+        self._ready = deque()
+        # keys with read requests still in _ready
+        self._queued = set()
+        self._handle = None
+        self.reads = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._targets)
+
+    def add(self, addr, endpoint, cluster, attributes):
+        """Read attributes of cluster on a device endpoint (ints) every interval"""
+        key = '{:04x}{:02x}'.format(addr, endpoint).encode()
+        clusters = self._targets.get(key)
+        if clusters is None:
+            clusters = self._targets[key] = {}
+            # first read anywhere in the interval, not all at startup
+            self._device.timers.schedule(('poll', key), random.uniform(0, self._interval),
+                                         partial(self._due, key, addr, endpoint))
+        known = clusters.setdefault(cluster, [])
+        known.extend(attribute for attribute in attributes if attribute not in known)
+
+    def remove(self, addr, endpoint):
+        key = '{:04x}{:02x}'.format(addr, endpoint).encode()
+        self._targets.pop(key, None)
+        self._seen.pop(key, None)
+        self._device.timers.cancel(('poll', key))
+
+    def seen(self, key):
+        """A report of address + endpoint was received"""
+        if key in self._targets:
+            self._seen[key] = self._loop.time()
+
+    def _jittered(self):
+        return self._interval * random.uniform(1 - ZGT_POLL_JITTER, 1 + ZGT_POLL_JITTER)
+
+    def _due(self, key, addr, endpoint):
+        clusters = self._targets.get(key)
+        if clusters is None:
+            return
+        action = partial(self._due, key, addr, endpoint)
+        if key in self._queued:
+            # previous reads not sent yet, the rate is too low for the interval
+            self.skipped += 1
+            self._device.timers.schedule(('poll', key), self._jittered(), action)
+            return
+        seen = self._seen.get(key)
+        if seen is not None:
+            quiet = self._loop.time() - seen
+            if quiet < self._interval:
+                # reported meanwhile, its state is fresh
+                self.skipped += 1
+                self._device.timers.schedule(('poll', key), self._jittered() - quiet, action)
+                return
+        for cluster, attributes in clusters.items():
+            self._ready.append((key, addr, endpoint, cluster, attributes))
+        self._queued.add(key)
+        self._device.timers.schedule(('poll', key), self._jittered(), action)
+        if self._handle is None:
+            self._send()
+
+    def _send(self):
+        """Send one read request, if nothing else is waiting for the ZiGate"""
+        self._handle = None
+        if not self._ready:
+            return
+        if not self._device.tx.size:
+            key, addr, endpoint, cluster, attributes = self._ready.popleft()
+            if not self._ready or self._ready[0][0] != key:
+                self._queued.discard(key)
+            self.reads += 1
+            self._device.async_read_attribute(addr, endpoint, cluster, attributes)
+        if self._ready:
+            self._handle = self._loop.call_later(1 / self._rate, self._send)
+
+    def stop(self):
+        self._ready.clear()
+        self._queued.clear()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
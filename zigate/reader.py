@@ -0,0 +1,143 @@
+"""
+Serial link read by a dedicated thread
+
+For high rate links : the thread owns the serial port, reads and frames
+the data (unescaping, checksum), interprets the frames with pyzigate
+(see ZiGateInterpreter), and hands them over to the event loop in
+batches, with one call_soon_threadsafe per batch whatever the number of
+frames. The loop only applies the properties & commands found.
+Commands are handed over to a writer thread : the loop never waits for
+the port.
+"""
+
+import logging
+import queue
+import threading
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+ZGT_READ_SIZE = 4096
+# secs, how long a read waits on an idle link (closing cancels it anyway)
+ZGT_READ_TIMEOUT = 0.5
+# secs, how long a write may wait for the port before the link is closed
+ZGT_WRITE_TIMEOUT = 2
+
+
+class ZiGateSerialThread:
+    """A transport reading a serial port in a thread (see ZiGateProtocol.frames_received)"""
+
+    def __init__(self, loop, port, protocol):
+        self._loop = loop
+        self._port = port
+        self._protocol = protocol
+        # frames decoded & interpreted by the thread (pyzigate calls), waiting for the loop
+        self._frames = deque()
+        self._calls = deque()
+        self._bytes = 0
+        self._drain_scheduled = False
+        self._lock = threading.Lock()
+        self._closing = False
+        # frames to write, None stops the writer
+        self._writes = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='ZiGate reader', daemon=True)
+        self._writer = threading.Thread(target=self._run_writer, name='ZiGate writer',
+                                        daemon=True)
+
+    def start(self):
+        self._writer.start()
+        self._thread.start()
+
+    def write(self, data):
+        if not self._closing:
+            self._writes.put_nowait(data)
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._writes.put_nowait(None)
+        if hasattr(self._port, 'cancel_read'):
+            self._port.cancel_read()
+        else:
+            self._port.close()
+
+    def join(self, timeout=None):
+        """Wait for the threads to be done with the port (and the capture) once closed"""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        decoder = self._protocol.decoder
+        interpret = self._protocol.interpret
+        capture = self._protocol.capture
+        port = self._port
+        exc = None
+        try:
+            while not self._closing:
+                data = port.read(max(1, min(port.in_waiting, ZGT_READ_SIZE)))
+                if not data:
+                    continue
+                if capture is not None:
+                    capture.write(data)
+                frames = decoder.feed(data)
+                calls = interpret(frames)
+                with self._lock:
+                    self._frames.extend(frames)
+                    self._calls.extend(calls)
+                    self._bytes += len(data)
+                    if self._drain_scheduled:
+                        continue
+                    self._drain_scheduled = True
+                self._loop.call_soon_threadsafe(self._drain)
+        except Exception as error:  # pylint: disable=broad-except
+            if not self._closing:
+                exc = error
+        finally:
+            self._closing = True
+            self._writes.put_nowait(None)
+            self._writer.join()
+            port.close()
+            self._loop.call_soon_threadsafe(self._protocol.connection_lost, exc)
+
+    def _run_writer(self):
+        port = self._port
+        while True:
+            data = self._writes.get()
+            if data is None:
+                return
+            try:
+                port.write(data)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not self._closing:
+                    _LOGGER.error('ZIGATE : Unable to write to the serial port (%s)', exc)
+                    self.close()
+                return
+
+    def _drain(self):
+        """All the frames interpreted since the last drain (on the loop)"""
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+            calls = list(self._calls)
+            self._calls.clear()
+            nbytes = self._bytes
+            self._bytes = 0
+            self._drain_scheduled = False
+        self._protocol.frames_received(frames, nbytes, calls=calls)
+
+
+async def create_threaded_serial_connection(loop, protocol_factory, url, baudrate):
+    """Like serial_asyncio.create_serial_connection, with a reader thread"""
+    import serial
+
+    port = await loop.run_in_executor(None, lambda: serial.serial_for_url(
+        url, baudrate=baudrate, timeout=ZGT_READ_TIMEOUT, write_timeout=ZGT_WRITE_TIMEOUT))
+    protocol = protocol_factory()
+    transport = ZiGateSerialThread(loop, port, protocol)
+    protocol.connection_made(transport)
+    transport.start()
+    return transport, protocol
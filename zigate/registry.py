@@ -0,0 +1,120 @@
+"""
+Persistent registry of the ZiGate devices
+
+Endpoints, clusters, model and last known attributes of every device,
+kept in <config>/zigate_devices.json so entities have a valid state
+right at startup without asking the mesh.
+The file is read once at startup, and written (atomically, compact json)
+in the executor at most once every save_delay secs.
+"""
+
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+ZGT_REGISTRY_FILE = 'zigate_devices.json'
+ZGT_REGISTRY_SAVE_DELAY = 30
+
+
+class ZiGateRegistry:
+    """
+    devices : short address (e.g. 'a1b2') ->
+        {'model': str, 'manufacturer': str, 'endpoints': {endpoint: descriptor},
+         'attributes': {endpoint: {property: data}}, 'groups': {endpoint: [group]}}
+    """
+
+    def __init__(self, hass, path, save_delay=ZGT_REGISTRY_SAVE_DELAY):
+        self._hass = hass
+        self._path = path
+        self._save_delay = save_delay
+        self._save_handle = None
+        self.devices = {}
+
+    async def async_load(self):
+        """Read the registry file (in the executor)"""
+        self.devices = await self._hass.async_add_job(self._load)
+        _LOGGER.debug('ZIGATE : %s devices loaded from registry', len(self.devices))
+
+    def _load(self):
+        try:
+            with open(self._path, encoding='utf-8') as registry_file:
+                return json.load(registry_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            _LOGGER.error('ZIGATE : Unable to read %s (%s), starting with an empty registry',
+                          self._path, exc)
+            return {}
+
+    def _device(self, addr):
+        device = self.devices.get(addr)
+        if device is None:
+            device = self.devices[addr] = {'model': None, 'endpoints': {}, 'attributes': {},
+                                           'groups': {}}
+        return device
+
+    def attributes(self, addr, endpoint):
+        """Last known attributes of a device endpoint (a copy)"""
+        device = self.devices.get(addr)
+        if device is None:
+            return {}
+        return dict(device['attributes'].get(endpoint, {}))
+
+    def update_attributes(self, addr, endpoint, attributes):
+        device = self._device(addr)
+        known = device['attributes'].get(endpoint)
+        if known is None:
+            device['attributes'][endpoint] = dict(attributes)
+        else:
+            known.update(attributes)
+        if 'type' in attributes:
+            device['model'] = attributes['type']
+        self.schedule_save()
+
+    def set_endpoints(self, addr, endpoints):
+        device = self._device(addr)
+        for endpoint in endpoints:
+            device['endpoints'].setdefault(endpoint, {})
+        self.schedule_save()
+
+    def set_descriptor(self, addr, endpoint, descriptor):
+        self._device(addr)['endpoints'][endpoint] = descriptor
+        self.schedule_save()
+
+    def set_model(self, addr, manufacturer, model):
+        device = self._device(addr)
+        device['manufacturer'] = manufacturer
+        if model is not None:
+            device['model'] = model
+        self.schedule_save()
+
+    def set_groups(self, addr, endpoint, groups):
+        # registries written before groups were kept have no 'groups'
+        self._device(addr).setdefault('groups', {})[endpoint] = groups
+        self.schedule_save()
+
+    def schedule_save(self):
+        """Save in a while, all changes until then are written at once"""
+        if self._save_handle is None:
+            self._save_handle = self._hass.loop.call_later(self._save_delay, self.async_save)
+
+    def async_save(self):
+        """Serialize now (on the loop), write in the executor"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        data = json.dumps(self.devices, separators=(',', ':'))
+        return self._hass.async_add_job(self._write, data)
+
+    def _write(self, data):
+        tmp_path = self._path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as registry_file:
+                registry_file.write(data)
+                registry_file.flush()
+                os.fsync(registry_file.fileno())
+            os.replace(tmp_path, self._path)
+        except OSError as exc:
+            _LOGGER.error('ZIGATE : Unable to write %s (%s)', self._path, exc)
@@ -0,0 +1,101 @@
+"""
+ZiGate pipeline statistics
+
+Plain counters and fixed bucket histograms, cheap enough to be always on :
+recording a value is a bisect in a short list and two additions.
+"""
+
+import time
+from bisect import bisect_left
+
+# histogram buckets upper bounds (secs)
+ZGT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+               0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class ZiGateHistogram:
+    """Distribution of durations (secs)"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(ZGT_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect_left(ZGT_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile"""
+        if not self.count:
+            return None
+        rank = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return ZGT_BUCKETS[i] if i < len(ZGT_BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        """count, mean, p50, p99 & max, durations in ms"""
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'p50_ms': ms(self.percentile(50)),
+            'p99_ms': ms(self.percentile(99)),
+            'max_ms': ms(self.max) if self.count else None,
+        }
+
+
+class ZiGateStats:
+    """Counters of a ZiGate pipeline (the protocol & ZiGate2HASS update them)"""
+
+    def __init__(self):
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.decode_time = ZiGateHistogram()
+        self.dispatch_time = ZiGateHistogram()
+        self._last = None
+        self._snapshot = None
+
+    def snapshot(self, device, max_age=1):
+        """
+        All statistics of device (a ZiGate2HASS) as a dict, rates are
+        computed since the previous snapshot (cached for max_age secs)
+        """
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._last[0] < max_age:
+            return self._snapshot
+        if self._last is None:
+            bytes_rate = frames_rate = None
+        else:
+            elapsed = now - self._last[0]
+            bytes_rate = round((self.bytes_received - self._last[1]) / elapsed, 1)
+            frames_rate = round((self.frames_received - self._last[2]) / elapsed, 1)
+        self._last = (now, self.bytes_received, self.frames_received)
+
+        self._snapshot = {
+            'bytes_received': self.bytes_received,
+            'bytes_per_second': bytes_rate,
+            'frames_received': self.frames_received,
+            'frames_per_second': frames_rate,
+            'decode_errors': device.decoder.errors,
+            'decode_time': self.decode_time.summary(),
+            'dispatch_time': self.dispatch_time.summary(),
+            'tx_queue_depth': device.tx.size,
+            'tx_ack_time': device.tx.ack_time.summary(),
+            'tx_retransmits': device.tx.retransmits,
+            'tx_dropped': device.tx.dropped,
+            'poll_reads': device.poller.reads,
+            'poll_skipped': device.poller.skipped,
+        }
+        return self._snapshot
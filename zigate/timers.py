@@ -0,0 +1,92 @@
+"""
+Shared timers for ZiGate entities
+
+A single heap of deadlines with one loop timer armed on the earliest one,
+so thousands of entities can have a pending timer (e.g. momentary switches
+auto-off) for the cost of one call_later handle.
+Re-scheduling a key just moves its deadline, the outdated heap entry
+is skipped when it comes up.
+"""
+
+import heapq
+import itertools
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ZiGateTimers:
+    """Keyed one-shot timers, to be used from the event loop"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        # key -> (deadline, action)
+        self._deadlines = {}
+        # (deadline, sequence, key), may contain outdated entries
+        self._heap = []
+        self._sequence = itertools.count()
+        self._handle = None
+        self._handle_deadline = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay, action):
+        """Run action() in delay secs, replacing any timer pending for key"""
+        deadline = self._loop.time() + delay
+        self._deadlines[key] = (deadline, action)
+        heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._deadlines):
+            self._compact()
+        self._arm()
+
+    def cancel(self, key):
+        """Cancel the timer pending for key (if any)"""
+        self._deadlines.pop(key, None)
+
+    def cancel_all(self):
+        self._deadlines.clear()
+        self._heap = []
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _compact(self):
+        """Drop outdated entries (keys re-scheduled many times)"""
+        self._heap = [(deadline, next(self._sequence), key)
+                      for key, (deadline, action) in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def _arm(self):
+        if not self._heap:
+            return
+        first = self._heap[0][0]
+        if self._handle is not None:
+            if self._handle_deadline <= first:
+                return
+            self._handle.cancel()
+        self._handle_deadline = first
+        self._handle = self._loop.call_at(first, self._run)
+
+    def _run(self):
+        self._handle = None
+        now = self._loop.time()
+        try:
+            # an action may compact or clear the heap
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self._heap)
+                entry = self._deadlines.get(key)
+                if entry is None or entry[0] != deadline:
+                    # cancelled or re-scheduled
+                    continue
+                del self._deadlines[key]
+                # a failing action doesn't hold up the other timers
+                try:
+                    entry[1]()
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('ZIGATE : Timer action of %s failed', key)
+        finally:
+            self._arm()
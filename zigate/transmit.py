@@ -0,0 +1,307 @@
+"""
+ZiGate transmit scheduler
+
+Every command sent to the ZiGate is answered by a 0x8000 status message.
+Commands are queued and only `window` of them are on the wire at a time,
+the next one is sent when the status of a previous one comes back
+(or when it timed out).
+
+Commands given a coalescing key (e.g. the level of a light) are
+latest-wins : a newer command with the same key replaces the previous one
+while it is still queued, and a key is sent at most once per interval.
+
+Commands wait in one lane per priority : interactive (entities commanded
+by the user) first, then configuration, then background reads. A lane
+can be limited to a rate (commands per second), and the head of a lower
+lane waiting more than starvation_delay goes first anyway.
+"""
+
+import logging
+from collections import deque
+
+from .stats import ZiGateHistogram
+
+_LOGGER = logging.getLogger(__name__)
+
+ZGT_STATUS_SUCCESS = 0
+ZGT_STATUS_BUSY = 4
+
+DEFAULT_TX_QUEUE_SIZE = 256
+DEFAULT_TX_WINDOW = 1
+DEFAULT_TX_TIMEOUT = 2.0
+DEFAULT_TX_RETRIES = 2
+DEFAULT_COALESCE_INTERVAL = 0.2
+DEFAULT_TX_MAX_AGE = 60
+DEFAULT_TX_STARVATION_DELAY = 5.0
+
+# priorities, one lane each
+ZGT_PRIORITY_INTERACTIVE = 0
+ZGT_PRIORITY_CONFIG = 1
+ZGT_PRIORITY_BACKGROUND = 2
+ZGT_PRIORITY_NAMES = ('interactive', 'config', 'background')
+
+
+class ZiGateTransmitQueue:
+    """Bounded queue of frames waiting for the ZiGate"""
+
+    def __init__(self, loop, write, max_size=DEFAULT_TX_QUEUE_SIZE,
+                 window=DEFAULT_TX_WINDOW, timeout=DEFAULT_TX_TIMEOUT,
+                 retries=DEFAULT_TX_RETRIES,
+                 coalesce_interval=DEFAULT_COALESCE_INTERVAL,
+                 max_age=DEFAULT_TX_MAX_AGE,
+                 starvation_delay=DEFAULT_TX_STARVATION_DELAY, rate_limits=None):
+        self._loop = loop
+        self._write = write
+        self._max_size = max_size
+        self._window = max(1, window)
+        self._timeout = timeout
+        self._retries = retries
+        self._coalesce_interval = coalesce_interval
+        # commands waiting longer than this (e.g. link down) are dropped
+        self._max_age = max_age
+        self._starvation_delay = starvation_delay
+        # lane -> deque of entries, min interval between 2 writes, time of last write
+        self._lanes = tuple(deque() for _ in ZGT_PRIORITY_NAMES)
+        self._intervals = [0] * len(ZGT_PRIORITY_NAMES)
+        for name, rate in (rate_limits or {}).items():
+            if rate:
+                self._intervals[ZGT_PRIORITY_NAMES.index(name)] = 1 / rate
+        self._lane_sent = [None] * len(ZGT_PRIORITY_NAMES)
+        # pump scheduled when a rate limit holds commands back
+        self._wakeup = None
+        self._inflight = []
+        # key -> entry not written yet / timer of an entry held back / time of last write
+        self._coalesced = {}
+        self._held = {}
+        self._last_sent = {}
+        # nothing can be written until a transport is bound
+        self._writable = False
+        self.dropped = 0
+        # called (without arguments) whenever a command is dropped
+        self.drop_listener = None
+        self.retransmits = 0
+        self.ack_time = ZiGateHistogram()
+
+    @property
+    def size(self):
+        """Number of commands waiting or on the wire"""
+        return sum(map(len, self._lanes)) + len(self._inflight) + len(self._held)
+
+    def waiting(self, priority):
+        """Number of commands waiting in a lane"""
+        return len(self._lanes[priority])
+
+    def put(self, msg_type, frame, key=None, priority=ZGT_PRIORITY_CONFIG):
+        """
+        Queue a frame (must be called from the event loop)
+        key : coalescing key, the frame replaces a queued one with the same key
+        priority : lane of the frame (ZGT_PRIORITY_*)
+        """
+        if key is not None:
+            entry = self._coalesced.get(key)
+            if entry is not None:
+                entry[0] = msg_type
+                entry[1] = frame
+                return True
+        if sum(map(len, self._lanes)) >= self._max_size and not self._make_room(priority):
+            self._drop(msg_type, 'queue full')
+            return False
+        # type, frame, retries left, timeout handle, coalescing key, queued at, sent at, lane
+        entry = [msg_type, frame, self._retries, None, key, self._loop.time(), None, priority]
+        if key is not None:
+            self._coalesced[key] = entry
+            last = self._last_sent.get(key)
+            if last is not None:
+                delay = last + self._coalesce_interval - self._loop.time()
+                if delay > 0:
+                    self._held[key] = self._loop.call_later(delay, self._release, key)
+                    return True
+        self._lanes[priority].append(entry)
+        self._pump()
+        return True
+
+    def discard(self, keys):
+        """
+        Drop the commands of these coalescing keys not written yet, and
+        don't resend the ones on the wire : a newer command overrides them
+        (e.g. off after a level still held back would be undone by the level)
+        """
+        for key in keys:
+            entry = self._coalesced.pop(key, None)
+            if entry is not None:
+                handle = self._held.pop(key, None)
+                if handle is not None:
+                    handle.cancel()
+                else:
+                    self._lanes[entry[7]].remove(entry)
+        for entry in self._inflight:
+            if entry[4] in keys:
+                entry[2] = 0
+
+    def flush(self, keys):
+        """
+        Queue the commands of these coalescing keys held back right now,
+        ahead of a command that must follow them on the wire
+        """
+        for key in keys:
+            handle = self._held.pop(key, None)
+            if handle is not None:
+                handle.cancel()
+                entry = self._coalesced[key]
+                self._lanes[entry[7]].append(entry)
+        self._pump()
+
+    def _make_room(self, priority):
+        """Full queue : drop the newest command of a lower lane, if any"""
+        for lane in range(len(self._lanes) - 1, priority, -1):
+            if self._lanes[lane]:
+                entry = self._lanes[lane].pop()
+                if entry[4] is not None and self._coalesced.get(entry[4]) is entry:
+                    del self._coalesced[entry[4]]
+                self._drop(entry[0], 'queue full')
+                return True
+        return False
+
+    def pause(self):
+        """Stop writing (transport buffer full or link down)"""
+        self._writable = False
+
+    def resume(self):
+        """Start writing again"""
+        self._writable = True
+        self._pump()
+
+    def put_front(self, commands):
+        """Queue (msg_type, frame) commands ahead of everything else"""
+        now = self._loop.time()
+        lane = self._lanes[ZGT_PRIORITY_INTERACTIVE]
+        for msg_type, frame in reversed(commands):
+            lane.appendleft([msg_type, frame, self._retries, None, None, now, None,
+                             ZGT_PRIORITY_INTERACTIVE])
+        self._pump()
+
+    def requeue(self):
+        """
+        Link lost : stop writing, commands not acknowledged yet
+        go back to the head of the queue to be sent again
+        """
+        self._writable = False
+        for entry in reversed(self._inflight):
+            entry[3].cancel()
+            self._lanes[entry[7]].appendleft(entry)
+        self._inflight = []
+
+    def clear(self):
+        """Drop all queued & unacknowledged commands"""
+        for entry in self._inflight:
+            if entry[3] is not None:
+                entry[3].cancel()
+        self._inflight = []
+        for lane in self._lanes:
+            lane.clear()
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        for handle in self._held.values():
+            handle.cancel()
+        self._held.clear()
+        self._coalesced.clear()
+
+    def status_received(self, status, msg_type):
+        """Handle a 0x8000 status for the command msg_type"""
+        for entry in self._inflight:
+            if entry[0] == msg_type:
+                break
+        else:
+            return
+        self._inflight.remove(entry)
+        entry[3].cancel()
+        self.ack_time.record(self._loop.time() - entry[6])
+        if status == ZGT_STATUS_BUSY:
+            self._retry(entry, 'busy')
+        elif status != ZGT_STATUS_SUCCESS:
+            _LOGGER.warning('ZIGATE : Command %04x failed with status %s', msg_type, status)
+        self._pump()
+
+    def _next_lane(self, now):
+        """
+        Lane of the next command to write : a starving lower lane, else the
+        first lane with commands, skipping the lanes over their rate
+        Returns (lane, None), or (None, secs until a rate limit allows a lane)
+        """
+        lanes = self._lanes
+        wait = None
+        for lane in range(len(lanes) - 1, 0, -1):
+            if lanes[lane] and now - lanes[lane][0][5] > self._starvation_delay:
+                delay = self._rate_delay(lane, now)
+                if delay <= 0:
+                    return lane, None
+        for lane, queue in enumerate(lanes):
+            if queue:
+                delay = self._rate_delay(lane, now)
+                if delay <= 0:
+                    return lane, None
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _rate_delay(self, lane, now):
+        last = self._lane_sent[lane]
+        if last is None or not self._intervals[lane]:
+            return 0
+        return last + self._intervals[lane] - now
+
+    def _wake(self):
+        self._wakeup = None
+        self._pump()
+
+    def _pump(self):
+        now = self._loop.time()
+        while self._writable and len(self._inflight) < self._window:
+            lane, wait = self._next_lane(now)
+            if lane is None:
+                if wait is not None and self._wakeup is None:
+                    self._wakeup = self._loop.call_later(wait, self._wake)
+                return
+            entry = self._lanes[lane].popleft()
+            if now - entry[5] > self._max_age:
+                if entry[4] is not None and self._coalesced.get(entry[4]) is entry:
+                    del self._coalesced[entry[4]]
+                self._drop(entry[0], 'too old')
+                continue
+            if entry[4] is not None and self._coalesced.get(entry[4]) is entry:
+                del self._coalesced[entry[4]]
+                self._last_sent[entry[4]] = now
+            entry[3] = self._loop.call_later(self._timeout, self._timed_out, entry)
+            entry[6] = now
+            self._lane_sent[lane] = now
+            self._inflight.append(entry)
+            self._write(entry[1])
+
+    def _release(self, key):
+        """Interval of a coalesced key elapsed, its latest frame can go"""
+        del self._held[key]
+        entry = self._coalesced[key]
+        self._lanes[entry[7]].append(entry)
+        self._pump()
+
+    def _timed_out(self, entry):
+        if entry not in self._inflight:
+            return
+        self._inflight.remove(entry)
+        self._retry(entry, 'timeout')
+        self._pump()
+
+    def _drop(self, msg_type, reason):
+        self.dropped += 1
+        _LOGGER.warning('ZIGATE : Command %04x dropped (%s)', msg_type, reason)
+        if self.drop_listener is not None:
+            self.drop_listener()
+
+    def _retry(self, entry, reason):
+        if entry[2] <= 0:
+            self._drop(entry[0], reason)
+            return
+        entry[2] -= 1
+        self.retransmits += 1
+        _LOGGER.debug('ZIGATE : Command %04x resent (%s)', entry[0], reason)
+        self._lanes[entry[7]].appendleft(entry)
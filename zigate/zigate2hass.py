@@ -1,11 +1,23 @@
 #! /usr/bin/python3
 import logging
+import threading
+import time
 from asyncio import Protocol
+from functools import partial
 
-from homeassistant.helpers.dispatcher import (dispatcher_send)
+from homeassistant.core import callback, is_callback
 from homeassistant.components import persistent_notification
 
 from .const import *
+from .framing import ZiGateFrameDecoder, ZiGateFrameTemplate, encode_frame
+from .transmit import (ZiGateTransmitQueue, ZGT_PRIORITY_INTERACTIVE, ZGT_PRIORITY_CONFIG,
+                       ZGT_PRIORITY_BACKGROUND)
+from .timers import ZiGateTimers
+from .poller import ZiGatePoller, DEFAULT_POLL_INTERVAL, DEFAULT_POLL_RATE
+from .stats import ZiGateStats
+from .availability import ZiGateAvailability, DEFAULT_AVAILABILITY_TIMEOUT
+from .interview import (ZiGateInterviewer, DEFAULT_INTERVIEW_CONCURRENCY,
+                        ZGT_ATTR_MANUFACTURER, ZGT_ATTR_MODEL)
 from pyzigate.zgt_parameters import *
 from pyzigate.interface import ZiGate
 
@@ -14,41 +26,532 @@ _LOGGER = logging.getLogger(__name__)
 
 class ZiGateProtocol(Protocol):
 
+    def __init__(self, device=None, connection=None, capture=None):
+        self.device = device
+        self.transport = None
+        self._connection = connection
+        # optional ZiGateCaptureWriter recording every chunk received
+        self.capture = capture
+        # the device decoder keeps its error count across reconnections
+        self.decoder = device.decoder if device is not None else ZiGateFrameDecoder()
+        # pyzigate interpretation off the loop, for a reader thread
+        self.interpreter = ZiGateInterpreter()
+
     def connection_made(self, transport):
         _LOGGER.debug('ZIGATE : Transport initialized : %s' % transport)
         self.transport = transport
+        self.decoder.reset()
 
     def data_received(self, data):
-        try:
-            self.device.read_data(data)
-        except:
-            _LOGGER.debug('ZIGATE : Data received but not ready {!r}'.
-                          format(data.decode()))
+        if self.capture is not None:
+            self.capture.write(data)
+        start = time.perf_counter()
+        self.frames_received(self.decoder.feed(data), len(data), start)
+
+    def interpret(self, frames):
+        """
+        pyzigate interpretation of decoded frames, in a reader thread :
+        the calls of each frame, for frames_received (see ZiGateInterpreter)
+        """
+        return [self.interpreter.interpret(frame) for frame in frames]
+
+    def frames_received(self, frames, nbytes, start=None, calls=None):
+        """
+        Interpret frames (already decoded, e.g. by a reader thread),
+        calls are their pyzigate interpretations when already done (interpret)
+        """
+        if start is None:
+            start = time.perf_counter()
+        device = self.device
+        if device is None:
+            if frames:
+                _LOGGER.debug('ZIGATE : %s frame(s) received but not ready', len(frames))
+            return
+        for i, frame in enumerate(frames):
+            try:
+                device.decode_data(frame, calls[i] if calls is not None else None)
+            except Exception:
+                _LOGGER.exception('ZIGATE : Unable to interpret frame %s', frame.hex())
+        stats = device.stats
+        stats.bytes_received += nbytes
+        stats.frames_received += len(frames)
+        stats.decode_time.record(time.perf_counter() - start)
+
+    def pause_writing(self):
+        if self.device is not None:
+            self.device.tx.pause()
+
+    def resume_writing(self):
+        if self.device is not None:
+            self.device.tx.resume()
 
     def connection_lost(self, exc):
         _LOGGER.debug('ZIGATE : Connection Lost !')
+        if self._connection is not None:
+            self._connection.connection_lost(exc)
+
+
+class ZiGateInterpreter(ZiGate):
+    """
+    pyzigate interpretation of frames outside of the event loop : the
+    properties & commands it finds are recorded, to be applied by
+    ZiGate2HASS.decode_data on the loop
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._calls = None
+
+    def interpret(self, frame):
+        """[(method name, args, kwargs)] of ZiGate2HASS for a decoded frame"""
+        calls = self._calls = []
+        try:
+            self.decode_data(frame)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception('ZIGATE : Unable to interpret frame %s', frame.hex())
+        self._calls = None
+        return calls
+
+    def set_device_property(self, addr, endpoint, property_id, property_data):
+        self._calls.append(('set_device_property',
+                            (addr, endpoint, property_id, property_data), None))
+
+    def set_external_command(self, command_type, **kwargs):
+        self._calls.append(('set_external_command', (command_type,), kwargs))
+
+
+class ZiGateBufferingTransport:
+    """
+    Stands for the transport until the link is up : frames written
+    meanwhile are kept, and flushed once the real transport is bound
+    """
+
+    def __init__(self):
+        self.buffer = []
+
+    def write(self, data):
+        self.buffer.append(data)
+
+    def is_closing(self):
+        return False
+
+
+# message type -> offset of the short address of the device it comes from
+# (in the whole message : type, length, checksum, payload)
+ZGT_SOURCE_OFFSETS = {
+    0x004d: 5,  # device announce
+    0x8043: 7,  # simple descriptor
+    0x8045: 7,  # active endpoints
+    0x8100: 6,  # attribute read
+    0x8102: 6,  # attribute report
+    0x8401: 10,  # zone status change
+}
+# properties whose latest value is enough, others pending for a device are
+# sent before being replaced (e.g. a press then a release in the same window)
+ZGT_LATEST_WINS = (ZGT_LAST_SEEN,)
+# polled devices not answering this many polls are unavailable
+ZGT_POLL_MISSED = 3
 
 
 class ZiGate2HASS(ZiGate):
 
-    def __init__(self, hass):
+    def __init__(self, hass, channel=ZGT_CHANNEL, update_window=ZGT_UPDATE_WINDOW,
+                 registry=None, name=ZGT_DEFAULT_NAME, poll_interval=DEFAULT_POLL_INTERVAL,
+                 poll_rate=DEFAULT_POLL_RATE,
+                 interview_concurrency=DEFAULT_INTERVIEW_CONCURRENCY,
+                 availability_timeout=DEFAULT_AVAILABILITY_TIMEOUT, **tx_options):
         super().__init__()
         self._hass = hass
+        self.name = name
+        self._channel = channel
+        # optional ZiGateRegistry persisting devices & last attributes
+        self.registry = registry
         self._known_devices = set()
         self._known_devices_full = set()
+        # entities update callbacks : address + endpoint (e.g. b'a1b201') -> [callbacks]
+        self._routes = {}
+        # properties waiting to be sent to entities : address + endpoint -> {property: data}
+        self._updates = {}
+        self._update_window = update_window
+        self._update_handle = None
+        # created on the event loop, commands from other threads are handed over
+        self._loop_thread = threading.get_ident()
+        self.tx = ZiGateTransmitQueue(hass.loop, self._write_frame, **tx_options)
+        # commands can be sent right away, they wait for the link
+        self.transport = ZiGateBufferingTransport()
+        self.send_to_transport = self.transport.write
+        self.timers = ZiGateTimers(hass.loop)
+        self.poller = ZiGatePoller(hass.loop, self, poll_interval, poll_rate)
+        self._poll_interval = poll_interval
+        self.availability = ZiGateAvailability(hass.loop, availability_timeout)
+        self.interviewer = ZiGateInterviewer(hass, self, interview_concurrency)
+        self.interviewer.add_listener(self._interviewed)
+        self.decoder = ZiGateFrameDecoder()
+        # (type, mode, addr, endpoint) -> ZiGateFrameTemplate of the entities commands
+        self._templates = {}
+        self.stats = ZiGateStats()
 
-    def set_device_property(self, addr, endpoint, property_id, property_data):
-        # decoding the address to assign the proper signal (bytes --> str)
-        if endpoint:
-            addrep = ZGT_SIGNAL_UPDATE.format(addr.decode() + endpoint.decode())
+    def bind_transport(self, transport):
+        """Start sending buffered & queued commands to the transport"""
+        placeholder = self.transport
+        self.transport = transport
+        self.send_to_transport = transport.write
+        if isinstance(placeholder, ZiGateBufferingTransport) and placeholder.buffer:
+            transport.write(b''.join(placeholder.buffer))
+        self.tx.resume()
+
+    def unbind_transport(self):
+        """Link lost, keep commands queued until a transport is bound again"""
+        self.transport = ZiGateBufferingTransport()
+        self.send_to_transport = self.transport.write
+        self.tx.requeue()
+
+    def stop(self):
+        """Hass is stopping : no more polls, timers or pending updates"""
+        self.poller.stop()
+        self.availability.stop()
+        self.timers.cancel_all()
+        if self._update_handle is not None:
+            self._update_handle.cancel()
+            self._update_handle = None
+
+    def start_network(self, channel=None):
+        """Set channel & coordinator mode, then start the network"""
+        if channel is not None:
+            self._channel = int(channel)
+        self.tx.put_front([
+            (0x0021, encode_frame(0x0021, bytes((0, 0, self._channel, 0)))),
+            (0x0023, encode_frame(0x0023, b'\x00')),
+            (0x0024, encode_frame(0x0024)),
+        ])
+
+    def _write_frame(self, frame):
+        self.send_to_transport(frame)
+
+    def send_data(self, cmd, data="", coalesce_key=None, priority=ZGT_PRIORITY_CONFIG):
+        """
+        Queue a command for the ZiGate (cmd & data as hex strings)
+        Commands with the same coalesce_key replace each other while queued
+        """
+        self.send_frame(int(cmd, 16), bytes.fromhex(data), coalesce_key, priority)
+
+    def send_frame(self, msg_type, payload=b'', coalesce_key=None, priority=ZGT_PRIORITY_CONFIG):
+        """Queue a command for the ZiGate (msg_type as int, raw payload)"""
+        frame = encode_frame(msg_type, payload)
+        if threading.get_ident() == self._loop_thread:
+            self.tx.put(msg_type, frame, coalesce_key, priority)
+        else:
+            self._hass.loop.call_soon_threadsafe(self.tx.put, msg_type, frame, coalesce_key,
+                                                 priority)
+
+    # Typed command API, to be called from the event loop
+    # addr is the short address & endpoint the destination endpoint (ints)
+    # with mode ZGT_ADDRESS_MODE_GROUP, addr is a group (endpoint is ignored) :
+    # one frame for all the members instead of a frame per device
+    # commands of the entities go in the interactive lane, ahead of reads
+
+    @staticmethod
+    def _destination(addr, endpoint, mode=ZGT_ADDRESS_MODE_SHORT):
+        """address mode, address, source endpoint 01, destination endpoint"""
+        return bytes((mode, addr >> 8, addr & 0xff, 0x01, endpoint))
+
+    def _template(self, msg_type, addr, endpoint, mode, fixed, variable_length):
+        """Pre-encoded frame of a command to a device : destination + fixed bytes"""
+        key = (msg_type, mode, addr, endpoint)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = ZiGateFrameTemplate(
+                msg_type, self._destination(addr, endpoint, mode) + fixed, variable_length)
+        return template
+
+    def _before_on_off(self, addr, endpoint, mode, on):
+        """
+        An on/off command goes on the wire after the level / temperature
+        commands sent before it : the ones held back are queued first.
+        Only an off overrides a level (move to level with on/off would
+        switch the light back on), a pending level is dropped then.
+        """
+        if not on:
+            self.tx.discard(((mode, addr, endpoint, 0x0081),))
+        self.tx.flush(((mode, addr, endpoint, 0x0081), (mode, addr, endpoint, 0x00C0)))
+
+    @callback
+    def async_on_off(self, addr, endpoint, on, mode=ZGT_ADDRESS_MODE_SHORT):
+        """Switch a device (or a group) on or off (0x0092)"""
+        self._before_on_off(addr, endpoint, mode, on)
+        template = self._template(0x0092, addr, endpoint, mode, b'', 1)
+        self.tx.put(0x0092, template.cached(b'\x01' if on else b'\x00'),
+                    priority=ZGT_PRIORITY_INTERACTIVE)
+
+    @callback
+    def async_on_with_timed_off(self, addr, endpoint, on_time, off_wait_time=0,
+                                mode=ZGT_ADDRESS_MODE_SHORT):
+        """
+        Switch a device (or a group) on for on_time, it switches off by itself
+        and ignores on commands for off_wait_time afterwards (0x0093, 1/10 s)
+        """
+        payload = (self._destination(addr, endpoint, mode) + b'\x00' +
+                   on_time.to_bytes(2, 'big') + off_wait_time.to_bytes(2, 'big'))
+        self._before_on_off(addr, endpoint, mode, True)
+        self.tx.put(0x0093, encode_frame(0x0093, payload), priority=ZGT_PRIORITY_INTERACTIVE)
+
+    @callback
+    def async_move_to_level(self, addr, endpoint, level, transition=0,
+                            mode=ZGT_ADDRESS_MODE_SHORT):
+        """Move to level with on/off (0x0081), transition in 1/10 s"""
+        # 255 is reserved by ZCL, 254 is the maximum level
+        level = min(level, 0xfe)
+        template = self._template(0x0081, addr, endpoint, mode, b'\x01', 3)
+        self.tx.put(0x0081, template.frame((level, transition >> 8, transition & 0xff)),
+                    (mode, addr, endpoint, 0x0081), ZGT_PRIORITY_INTERACTIVE)
+
+    @callback
+    def async_move_to_colour_temperature(self, addr, endpoint, temperature, transition=0,
+                                         mode=ZGT_ADDRESS_MODE_SHORT):
+        """Move to colour temperature (0x00C0), transition in 1/10 s"""
+        template = self._template(0x00C0, addr, endpoint, mode, b'', 4)
+        self.tx.put(0x00C0, template.frame((temperature >> 8, temperature & 0xff,
+                                            transition >> 8, transition & 0xff)),
+                    (mode, addr, endpoint, 0x00C0), ZGT_PRIORITY_INTERACTIVE)
+
+    @callback
+    def async_read_attribute(self, addr, endpoint, cluster, attributes,
+                             priority=ZGT_PRIORITY_BACKGROUND):
+        """Read one or several attributes of a cluster (0x0100), in the background"""
+        payload = bytearray(self._destination(addr, endpoint))
+        payload += cluster.to_bytes(2, 'big')
+        # direction, manufacturer specific, manufacturer id
+        payload += b'\x00\x00\x00\x00'
+        payload.append(len(attributes))
+        for attribute in attributes:
+            payload += attribute.to_bytes(2, 'big')
+        self.tx.put(0x0100, encode_frame(0x0100, payload), priority=priority)
+
+    # Groups : the membership is kept on the devices themselves
+
+    @callback
+    def async_add_group(self, addr, endpoint, group):
+        """Add a device endpoint to a group (0x0060)"""
+        self.tx.put(0x0060, encode_frame(0x0060, self._destination(addr, endpoint) +
+                                         group.to_bytes(2, 'big')))
+
+    @callback
+    def async_remove_group(self, addr, endpoint, group):
+        """Remove a device endpoint from a group (0x0063)"""
+        self.tx.put(0x0063, encode_frame(0x0063, self._destination(addr, endpoint) +
+                                         group.to_bytes(2, 'big')))
+
+    @callback
+    def async_get_group_membership(self, addr, endpoint, groups=()):
+        """Ask for the groups of a device endpoint (0x0062), all of them by default"""
+        payload = bytearray(self._destination(addr, endpoint))
+        payload.append(len(groups))
+        for group in groups:
+            payload += group.to_bytes(2, 'big')
+        self.tx.put(0x0062, encode_frame(0x0062, payload))
+
+    def poll(self, addrep, cluster, attributes):
+        """
+        Read attributes (ints) of a cluster of a device (address + endpoint,
+        e.g. 'a1b201') periodically, unless the device reports by itself
+        """
+        args = (int(addrep[:4], 16), int(addrep[4:6], 16), cluster, attributes)
+        # read at least every poll interval : a few reads without answer and it's gone
+        expect = (addrep[:4].lower(), ZGT_POLL_MISSED * self._poll_interval)
+        if threading.get_ident() == self._loop_thread:
+            self.poller.add(*args)
+            self.availability.expect(*expect)
+        else:
+            self._hass.loop.call_soon_threadsafe(self.poller.add, *args)
+            self._hass.loop.call_soon_threadsafe(self.availability.expect, *expect)
+
+    def decode_data(self, data, calls=None):
+        """
+        Interpret a decoded frame, calls are the ones of its pyzigate
+        interpretation when already done by a reader thread (ZiGateInterpreter)
+        """
+        # any frame from a device tells it is alive
+        offset = ZGT_SOURCE_OFFSETS.get((data[0] << 8) | data[1])
+        if offset is not None and len(data) >= offset + 2:
+            self.availability.seen(data[offset:offset + 2].hex())
+        # status (0x8000) : <status:1><sequence:1><packet type:2>
+        if data[0] == 0x80 and data[1] == 0x00 and len(data) >= 9:
+            self.tx.status_received(data[5], (data[7] << 8) | data[8])
+        elif data[0] == 0x81 and data[1] in (0x00, 0x02):
+            if data[1] == 0x02 and len(data) >= 9:
+                # a report (not the answer to a read) : no need to poll this device
+                self.poller.seen(data[6:9].hex().encode())
+            self._light_attribute(data[5:])
+            if data[1] == 0x00:
+                self._basic_attribute(data[5:])
+        elif data[0] == 0x80 and data[1] == 0x43:
+            self._simple_descriptor(data[5:])
+        elif data[0] == 0x80 and data[1] == 0x62:
+            self._group_membership(data[5:])
+        if calls is None:
+            super().decode_data(data)
         else:
-            addrep = ZGT_SIGNAL_UPDATE.format(addr.decode())
+            for name, args, kwargs in calls:
+                getattr(self, name)(*args, **(kwargs or {}))
+        # commit the properties of this frame (or of all frames in the window)
+        if self._updates and self._update_handle is None:
+            if self._update_window > 0:
+                self._update_handle = self._hass.loop.call_later(
+                    self._update_window, self._commit_updates)
+            else:
+                self._commit_updates()
 
-        _LOGGER.debug('ZIGATE SIGNAL :')
-        _LOGGER.debug('- Signal   : {}'.format(addrep))
-        _LOGGER.debug('- Property : {}'.format(property_id))
-        _LOGGER.debug('- Data     : {}'.format(property_data))
-        dispatcher_send(self._hass, addrep, property_id, property_data)
+    def register_entity(self, addrep, update_callback):
+        """
+        Route the updates of a device (address + endpoint, e.g. 'a1b201')
+        to an entity, returns a function removing the route
+        Callbacks not decorated with @callback are run in the executor
+        """
+        key = addrep.lower().encode()
+        if not is_callback(update_callback):
+            update_callback = partial(self._hass.async_add_job, update_callback)
+        callbacks = self._routes.setdefault(key, [])
+        callbacks.append(update_callback)
+
+        def unregister():
+            callbacks.remove(update_callback)
+            if not callbacks and self._routes.get(key) is callbacks:
+                del self._routes[key]
+        return unregister
+
+    def _flush_updates(self):
+        """Send the pending properties now, before the end of the window"""
+        if self._update_handle is not None:
+            self._update_handle.cancel()
+        self._commit_updates()
+
+    def _commit_updates(self):
+        """Send all pending properties, one update per entity"""
+        self._update_handle = None
+        start = time.perf_counter()
+        updates = self._updates
+        self._updates = {}
+        routes = self._routes
+        registry = self.registry
+        for key, attributes in updates.items():
+            if registry is not None:
+                registry.update_attributes(key[:4].decode(), key[4:].decode(), attributes)
+            callbacks = routes.get(key)
+            if callbacks:
+                for update_callback in callbacks:
+                    update_callback(attributes)
+        self.stats.dispatch_time.record(time.perf_counter() - start)
+
+    def _light_attribute(self, msg):
+        """
+        Light attributes, not interpreted by pyzigate (0x8100 / 0x8102) :
+        <sequence><addr:2><endpoint><cluster:2><attribute:2><status><type><size:2><data>
+        """
+        if len(msg) < 13 or msg[8] != 0:
+            return
+        cluster = (msg[4] << 8) | msg[5]
+        attribute = (msg[6] << 8) | msg[7]
+        data = msg[12:12 + ((msg[10] << 8) | msg[11])]
+        if not data:
+            return
+        if cluster == 0x0006 and attribute == 0x0000:
+            prop = (ZGT_ATTR_ONOFF, data[0] == 1)
+        elif cluster == 0x0008 and attribute == 0x0000:
+            prop = (ZGT_ATTR_LEVEL, data[0])
+        elif cluster == 0x0300 and attribute == 0x0007 and len(data) >= 2:
+            prop = (ZGT_ATTR_COLOUR_TEMPERATURE, (data[0] << 8) | data[1])
+        else:
+            return
+        self.set_device_property(msg[1:3].hex().encode(), '{:02x}'.format(msg[3]).encode(), *prop)
+
+    def _simple_descriptor(self, msg):
+        """
+        Keep the clusters of an endpoint (0x8043) :
+        <sequence><status><addr:2><length><endpoint><profile:2><device id:2><bit field>
+        <in count><in clusters:2*n><out count><out clusters:2*n>
+        """
+        if len(msg) < 12 or msg[1] != 0:
+            return
+        in_count = msg[11]
+        pos = 12 + 2 * in_count
+        if len(msg) <= pos:
+            return
+        out_count = msg[pos]
+        addr = msg[2:4].hex()
+        endpoint = '{:02x}'.format(msg[5])
+        descriptor = {
+            'profile': '{:04x}'.format(int.from_bytes(msg[6:8], 'big')),
+            'device_id': '{:04x}'.format(int.from_bytes(msg[8:10], 'big')),
+            'in_clusters': [msg[i:i + 2].hex() for i in range(12, pos, 2)],
+            'out_clusters': [msg[i:i + 2].hex() for i in range(pos + 1, pos + 1 + 2 * out_count, 2)],
+        }
+        if self.registry is not None:
+            self.registry.set_descriptor(addr, endpoint, descriptor)
+        self.interviewer.descriptor_received(addr, endpoint, descriptor)
+
+    def _basic_attribute(self, msg):
+        """
+        Manufacturer & model read by an interview (0x8100, basic cluster), same
+        layout as _light_attribute
+        """
+        if len(msg) < 12 or msg[4:6] != b'\x00\x00' or msg[6] != 0:
+            return
+        attribute = msg[7]
+        if attribute not in (ZGT_ATTR_MANUFACTURER, ZGT_ATTR_MODEL):
+            return
+        if msg[8] == 0:
+            value = msg[12:12 + ((msg[10] << 8) | msg[11])].decode(errors='replace')
+            value = value.rstrip('\x00')
+        else:
+            # unsupported attribute
+            value = None
+        self.interviewer.basic_received(msg[1:3].hex(), attribute, value)
+
+    def _group_membership(self, msg):
+        """
+        Groups of a device endpoint (0x8062) :
+        <sequence><endpoint><cluster:2><capacity><group count><groups:2*n><source addr:2>
+        """
+        if len(msg) < 6:
+            return
+        count = msg[5]
+        end = 6 + 2 * count
+        if len(msg) < end + 2:
+            # firmwares before 3.0f don't tell which device answered
+            return
+        addr = msg[end:end + 2].hex()
+        endpoint = '{:02x}'.format(msg[1])
+        groups = [msg[i:i + 2].hex() for i in range(6, end, 2)]
+        if self.registry is not None:
+            self.registry.set_groups(addr, endpoint, groups)
+        title = 'Groups of device {} endpoint {} :'.format(addr, endpoint)
+        persistent_notification.async_create(self._hass, '\n'.join(groups) or 'none',
+                                             title=title)
+
+    def cached_attributes(self, addrep):
+        """Last known attributes of a device (address + endpoint, e.g. 'a1b201')"""
+        if self.registry is None:
+            return {}
+        addrep = addrep.lower()
+        return self.registry.attributes(addrep[:4], addrep[4:6])
+
+    def get_stats(self):
+        """Statistics of the whole pipeline (see stats.py)"""
+        return self.stats.snapshot(self)
+
+    def set_device_property(self, addr, endpoint, property_id, property_data):
+        # addr & endpoint are hex bytes (e.g. b'a1b2', b'01')
+        key = addr + endpoint if endpoint else addr
+        attributes = self._updates.get(key)
+        if attributes is None:
+            self._updates[key] = {property_id: property_data}
+        elif (property_id in attributes and attributes[property_id] != property_data and
+              property_id not in ZGT_LATEST_WINS):
+            # an event would be lost, the pending properties go first
+            self._flush_updates()
+            self._updates[key] = {property_id: property_data}
+        else:
+            attributes[property_id] = property_data
 
     def set_external_command(self, cmd, **msg):
         if cmd == ZGT_CMD_NEW_DEVICE:
@@ -57,11 +560,29 @@ class ZiGate2HASS(ZiGate):
                 persistent_notification.async_create(self._hass, 'New device {} paired !'.
                                                      format(addr),
                                                      title='Zigate Breaking News !')
+                self.interviewer.interview(addr)
         elif cmd == ZGT_CMD_LIST_ENDPOINTS:
+            if self.registry is not None:
+                self.registry.set_endpoints(msg['addr'], msg['endpoints'])
+            if self.interviewer.interviewing(msg['addr']):
+                # the interview goes on, its result is notified at the end
+                self.interviewer.endpoints_received(msg['addr'], msg['endpoints'])
+                return
             ep_list = '\n'.join(msg['endpoints'])
             title = 'Endpoint list for device {} :'.format(msg['addr'])
             persistent_notification.async_create(self._hass, ep_list, title=title)
 
+    def _interviewed(self, addr, result):
+        # devices announce again when they rejoin, no need for a new interview
+        self.add_known_device(addr)
+        if self.registry is not None:
+            self.registry.set_model(addr, result['manufacturer'], result['model'])
+        lines = ['{} {}'.format(result['manufacturer'] or '', result['model'] or '').strip()]
+        for endpoint, descriptor in sorted(result['endpoints'].items()):
+            lines.append('{} : {}'.format(endpoint, ' '.join(descriptor.get('in_clusters', ()))))
+        title = 'Device {} interviewed :'.format(addr)
+        persistent_notification.async_create(self._hass, '\n'.join(lines), title=title)
+
     def add_known_device(self, device_address):
         self._known_devices_full.add(device_address[:6])
         self._known_devices.add(device_address[:4])